@@ -1 +1,6 @@
-from .main import app  # noqa: F401
+import time
+
+# Read by app.main to report how long importing the application took.
+IMPORT_STARTED = time.perf_counter()
+
+from .main import app  # noqa: F401,E402
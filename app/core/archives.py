@@ -0,0 +1,105 @@
+"""ZIP archive of the invoice PDFs, streamed while it is built."""
+import asyncio
+import re
+import zipfile
+from collections import deque
+
+from app import settings
+from app.core.documents import Invoice
+from app.core.jobs import enqueue_pdf_jobs, wait_for_jobs
+from app.core.streaming import ZipStream
+from app.core.utils import get_object_body_async, run_in_s3_executor
+
+
+CHUNK_SIZE = 256 * 1024
+
+unsafe_characters = re.compile(r'[^\w.-]+')
+
+
+async def render_missing_pdfs(query: dict, user_id):
+    missing = await Invoice.find({**query, 'filename': None}).to_list()
+    job_ids = await enqueue_pdf_jobs(missing, user_id)
+    if job_ids:
+        await wait_for_jobs(job_ids, settings.ARCHIVE_RENDER_TIMEOUT)
+
+
+def _close_body(fetch):
+    if not fetch.cancelled() and fetch.exception() is None \
+            and fetch.result() is not None:
+        fetch.result().close()
+
+
+def entry_name(reference: str, used: set) -> str:
+    name = unsafe_characters.sub('_', reference) or 'invoice'
+    candidate, suffix = name, 1
+    while candidate in used:
+        suffix += 1
+        candidate = f'{name}-{suffix}'
+    used.add(candidate)
+    return candidate + '.pdf'
+
+
+async def invoice_pdf_archive(query: dict, user_id,
+                              render_missing: bool = False):
+    """Yield the bytes of a ZIP holding the PDF of each matching invoice.
+
+    Up to ARCHIVE_CONCURRENCY objects are requested ahead of the one being
+    written, and each object is copied chunk by chunk, so neither whole
+    PDFs nor the archive are held in memory. Invoices without a PDF are
+    listed in ``missing.txt``.
+    """
+    if render_missing:
+        await render_missing_pdfs(query, user_id)
+    archive = ZipStream()
+    cursor = Invoice.get_motor_collection().find(
+        query, projection={'reference': True, 'filename': True},
+        sort=[('emited', 1), ('_id', 1)])
+    window = deque()
+    missing = []
+    used = set()
+    writing = None
+
+    async def write_next():
+        nonlocal writing
+        reference, fetch = window.popleft()
+        body = await fetch
+        if body is None:
+            missing.append(reference)
+            return
+        writing = body
+        try:
+            with archive.open(entry_name(reference, used),
+                              compress_type=zipfile.ZIP_STORED) as entry:
+                while True:
+                    chunk = await run_in_s3_executor(body.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    yield archive.drain()
+        finally:
+            body.close()
+
+    try:
+        async for invoice in cursor:
+            if not invoice.get('filename'):
+                missing.append(invoice['reference'])
+                continue
+            window.append((invoice['reference'], asyncio.ensure_future(
+                get_object_body_async(invoice['filename'] + '.pdf'))))
+            if len(window) > settings.ARCHIVE_CONCURRENCY:
+                async for data in write_next():
+                    yield data
+        while window:
+            async for data in write_next():
+                yield data
+    finally:
+        # On a client disconnect, each body holds a pooled S3 connection
+        # until it is closed: the one being written, those already fetched
+        # and those still in flight once they arrive.
+        if writing is not None:
+            writing.close()
+        for _, fetch in window:
+            fetch.add_done_callback(_close_body)
+    if missing:
+        archive.writestr('missing.txt', '\n'.join(sorted(missing)) + '\n')
+    yield archive.close()
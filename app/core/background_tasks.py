@@ -1,22 +1,33 @@
-from invoice_generator.invoice_generator import InvoiceGenerator
-from invoice_generator import models
+import time
 
-from app import settings
 from app.core.utils import upload_file
 
 
-async def generate_pdf_invoice(invoice, issuer, customer, invoice_name=None):
-    issuer = models.Issuer(**issuer.dict())
-    invoice_data = invoice.dict()
+def render_pdf(invoice_data, issuer, customer, invoice_name=None):
+    """Build the PDF of an invoice or a quotation and upload it to S3.
+
+    Runs in a worker process of the PDF job queue: arguments are plain
+    dicts and the return value is the name of the uploaded PDF (without
+    extension) with the times spent rendering and uploading it, since
+    metrics recorded in the worker process would be lost.
+    """
+    # Imported here, in the worker process only: it pulls in the LaTeX
+    # templating stack, which the API process never needs.
+    from invoice_generator import models
+    from app.core.latex import render_invoice, scratch_directory
+
+    started = time.perf_counter()
+    invoice_data = dict(invoice_data)
     invoice_data.pop('issuer')
     invoice_data.pop('customer')
     invoice_data = models.Invoice(**invoice_data,
-                                  issuer=issuer,
+                                  issuer=models.Issuer(**issuer),
                                   customer=customer)
-    generator = InvoiceGenerator(invoice_data,
-                                 invoice_name=invoice_name,
-                                 output_directory=settings.LATEX_TEMP_DIR)
-    output_path = generator.run()
-    invoice.filename = generator.invoice_name
-    await invoice.save()
-    upload_file(str(output_path))
+    with scratch_directory() as directory:
+        renderer = render_invoice(invoice_data, directory, invoice_name)
+        output_path = directory / f'{renderer.invoice_name}.pdf'
+        render_time = time.perf_counter() - started
+        if not upload_file(str(output_path)):
+            raise RuntimeError(f"Unable to upload {output_path.name}")
+    upload_time = time.perf_counter() - started - render_time
+    return renderer.invoice_name, render_time, upload_time
@@ -0,0 +1,97 @@
+"""Bulk creation of invoices and quotations."""
+from collections import defaultdict
+from typing import List, Tuple
+
+from beanie import PydanticObjectId
+from pymongo.errors import BulkWriteError
+
+from app import settings
+from app.core.documents import Customer
+from app.core.models import BulkCreateResult, BulkCreateSchema, BulkItemResult
+from app.core.sequences import record_references, reserve_references
+
+
+DUPLICATE_KEY = 11000
+
+
+async def bulk_create(document_cls, payload: BulkCreateSchema,
+                      user_id) -> Tuple[BulkCreateResult, List]:
+    """Create the documents of the payload with batched ``insert_many``.
+
+    Customers are checked with one query, references are reserved with one
+    counter update per year. With ``ordered`` the creation stops at the
+    first failing item, otherwise every valid item is written. References
+    reserved for items that failed are not reused.
+
+    Return the per-item results and the created documents.
+    """
+    items = payload.items
+    results = [BulkItemResult(index=i) for i in range(len(items))]
+
+    customers = {item.customer for item in items}
+    owned = set(await Customer.get_motor_collection().distinct(
+        '_id', {'_id': {'$in': list(customers)}, 'user': user_id}))
+
+    await record_references(document_cls, user_id,
+                            [(item.reference, item.emited.year)
+                             for item in items])
+    by_year = defaultdict(list)
+    for i, item in enumerate(items):
+        if not item.reference:
+            by_year[item.emited.year].append(i)
+    for year, indexes in by_year.items():
+        references = await reserve_references(document_cls, user_id, year,
+                                              len(indexes))
+        for i, reference in zip(indexes, references):
+            items[i].reference = reference
+
+    documents = []
+    for i, item in enumerate(items):
+        results[i].reference = item.reference
+        if item.customer not in owned:
+            results[i].error = "Customer not found"
+            if payload.ordered:
+                break
+            continue
+        document = document_cls(**item.dict(), issuer=user_id)
+        document.id = PydanticObjectId()
+        documents.append((i, document))
+
+    created = []
+    collection = document_cls.get_motor_collection()
+    for start in range(0, len(documents), settings.BULK_BATCH_SIZE):
+        batch = documents[start:start + settings.BULK_BATCH_SIZE]
+        failed = {}
+        try:
+            await collection.insert_many(
+                [document.dict(by_alias=True) for _, document in batch],
+                ordered=payload.ordered)
+        except BulkWriteError as e:
+            for error in e.details['writeErrors']:
+                failed[error['index']] = "Already exists" \
+                    if error['code'] == DUPLICATE_KEY else error['errmsg']
+        for position, (i, document) in enumerate(batch):
+            if position in failed:
+                results[i].error = failed[position]
+            elif payload.ordered and failed and position > min(failed):
+                results[i].error = "Not inserted"
+            else:
+                results[i].id = document.id
+                created.append(document)
+        if payload.ordered and failed:
+            for i, _ in documents[start + len(batch):]:
+                results[i].error = "Not inserted"
+            break
+    if payload.ordered:
+        for result in results:
+            if result.id is None and result.error is None:
+                result.error = "Not inserted"
+    return BulkCreateResult(created=len(created), results=results), created
+
+
+def bulk_status(result: BulkCreateResult) -> int:
+    """201 when every item was created, 207 when only some were, 422 when
+    none was."""
+    if result.created == len(result.results):
+        return 201
+    return 207 if result.created else 422
@@ -5,7 +5,10 @@ from beanie import Document, PydanticObjectId
 import pymongo
 from pymongo import IndexModel
 from pydantic import EmailStr, HttpUrl, validator, root_validator
-from .models import Address, Prestation
+from app import settings
+from .models import Address, JobStatus, Prestation, VatRate
+from .money import totals
+from .utils import customer_fingerprint
 
 
 class Customer(Document):
@@ -17,6 +20,8 @@ class Customer(Document):
     address: Optional[Address]
     email: Optional[EmailStr]
     phone: Optional[str]
+    fingerprint: Optional[str]
+    version: int = 0
 
     @root_validator(pre=True)
     def check_name(cls, values):
@@ -24,8 +29,22 @@ class Customer(Document):
             raise ValueError('Name cannot be left empty for company.')
         return values
 
+    @root_validator(skip_on_failure=True)
+    def set_fingerprint(cls, values):
+        values['fingerprint'] = customer_fingerprint(values)
+        return values
+
     class Collection:
         name = "customers"
+        declared_indexes = [
+            IndexModel([('fingerprint', pymongo.ASCENDING)], unique=True,
+                       partialFilterExpression={
+                           'fingerprint': {'$type': 'string'}}),
+            IndexModel([('user', pymongo.ASCENDING),
+                        ('name', pymongo.ASCENDING)]),
+            IndexModel([('user', pymongo.ASCENDING),
+                        ('_id', pymongo.ASCENDING)]),
+        ]
 
     class Settings:
         use_revision = False
@@ -38,17 +57,34 @@ class Invoice(Document):
     customer: PydanticObjectId
     prestations: List[Prestation]
     filename: Optional[str]
+    render_hash: Optional[str]
     total_without_charge: float = None
-
-    @validator("total_without_charge", pre=True, always=True)
-    def compute_total_without_charge(cls, v, values):
-        return sum([presta.total for presta in values['prestations']])
+    total_without_charge_cents: int = None
+    total_vat_cents: int = None
+    total_cents: int = None
+    vat_breakdown: List[VatRate] = []
+    version: int = 0
+
+    @root_validator(skip_on_failure=True)
+    def compute_totals(cls, values):
+        values.update(totals(values['prestations']))
+        values['vat_breakdown'] = [VatRate(**line)
+                                   for line in values['vat_breakdown']]
+        return values
 
     class Settings:
         use_revision = False
 
     class Collection:
         name = "invoices"
+        declared_indexes = [
+            IndexModel([('issuer', pymongo.ASCENDING),
+                        ('emited', pymongo.DESCENDING),
+                        ('_id', pymongo.DESCENDING)]),
+            IndexModel([('issuer', pymongo.ASCENDING),
+                        ('reference', pymongo.ASCENDING)],
+                       unique=True),
+        ]
 
 
 class Quotation(Invoice):
@@ -56,6 +92,95 @@ class Quotation(Invoice):
     
     class Collection:
         name = "quotations"
+        declared_indexes = Invoice.Collection.declared_indexes
+
+
+class PrestationStat(Document):
+    issuer: UUID
+    title: str
+    month: datetime
+    lines: int = 0
+    total_unit: float = 0
+    total_without_charge_cents: int = 0
+    min_price_cents: int
+    max_price_cents: int
+
+    class Collection:
+        name = "prestation_stats"
+        declared_indexes = [
+            IndexModel([('issuer', pymongo.ASCENDING),
+                        ('month', pymongo.ASCENDING),
+                        ('title', pymongo.ASCENDING)],
+                       unique=True),
+        ]
+
+
+class RevenueMonth(Document):
+    issuer: UUID
+    month: datetime
+    invoices: int = 0
+    total_without_charge_cents: int = 0
+    total_vat_cents: int = 0
+    total_cents: int = 0
+
+    class Collection:
+        name = "revenue_months"
+        declared_indexes = [
+            IndexModel([('issuer', pymongo.ASCENDING),
+                        ('month', pymongo.ASCENDING)],
+                       unique=True),
+        ]
+
+
+class ReferenceCounter(Document):
+    user: UUID
+    kind: str
+    year: int
+    value: int = 0
+    # Numbering scheme of the user, see app.core.sequences.
+    prefix: Optional[str]
+    width: Optional[int]
+
+    class Collection:
+        name = "reference_counters"
+        declared_indexes = [
+            IndexModel([('user', pymongo.ASCENDING),
+                        ('kind', pymongo.ASCENDING),
+                        ('year', pymongo.ASCENDING)],
+                       unique=True),
+        ]
+
+
+class PdfJob(Document):
+    user: UUID
+    kind: str
+    document: PydanticObjectId
+    status: JobStatus = JobStatus.queued
+    attempts: int = 0
+    error: Optional[str]
+    created: datetime = None
+    available_at: datetime = None
+    started: Optional[datetime]
+    finished: Optional[datetime]
+    render_time: Optional[float]
+    cached: bool = False
+
+    @validator('created', pre=True, always=True)
+    def set_created(cls, v):
+        return v or datetime.now()
+
+    @validator('available_at', pre=True, always=True)
+    def set_available_at(cls, v, values):
+        return v or values['created']
+
+    class Collection:
+        name = "pdf_jobs"
+        declared_indexes = [
+            IndexModel([('status', pymongo.ASCENDING),
+                        ('available_at', pymongo.ASCENDING)]),
+            IndexModel([('document', pymongo.ASCENDING),
+                        ('status', pymongo.ASCENDING)]),
+        ]
 
 
 class S3Link(Document):
@@ -69,9 +194,10 @@ class S3Link(Document):
 
     class Collection:
         name = "s3_links"
-        indexes = [
+        declared_indexes = [
             IndexModel(
                 [('created', pymongo.DESCENDING)],
-                expireAfterSeconds=3600
-            )
+                expireAfterSeconds=settings.PUBLIC_LINK_EXPIRATION
+            ),
+            IndexModel([('document', pymongo.ASCENDING)]),
         ]
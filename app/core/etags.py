@@ -0,0 +1,101 @@
+"""Strong ETags and conditional requests.
+
+Invoices, quotations and customers carry a ``version`` incremented by
+every write. The ETag of a document is derived from its id, its version
+and the selected fields, the ETag of a page from those of its documents
+and the cursor of the next page. A client sending a matching
+``If-None-Match`` receives a 304 and the body is never serialized. The
+version is readable in the ETag of a document, so an ``If-Match`` turns
+into a condition of the update itself.
+"""
+import hashlib
+import re
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.responses import ORJSONResponse
+
+
+FULL_ETAG = re.compile(r'"([0-9a-f]{24})-(\d+)"')
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1('\x1f'.join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _identity(document):
+    """Id and version of a document or of a raw Mongo dict."""
+    if isinstance(document, dict):
+        return document['_id'], document.get('version', 0)
+    return document.id, document.version
+
+
+def _selected(projection: Optional[dict]) -> str:
+    return ','.join(sorted(projection)) if projection else ''
+
+
+def document_etag(document, projection: Optional[dict] = None) -> str:
+    """``"<id>-<version>"``, followed by a digest of the selected fields
+    for a partial representation."""
+    etag = '{}-{}'.format(*_identity(document))
+    if projection:
+        digest = hashlib.sha1(_selected(projection).encode()).hexdigest()
+        etag = f'{etag}-{digest[:12]}'
+    return f'"{etag}"'
+
+
+def page_etag(documents: Iterable, next_cursor: Optional[str],
+              projection: Optional[dict] = None) -> str:
+    """Changes whenever a document of the page is added, removed or
+    updated."""
+    versions = ('{}:{}'.format(*_identity(document))
+                for document in documents)
+    return make_etag(_selected(projection), next_cursor or '', *versions)
+
+
+def etag_matches(header: Optional[str], etag: str, weak=False) -> bool:
+    """Whether ``etag`` is listed in an If-Match or If-None-Match header.
+
+    If-None-Match uses the weak comparison, where ``W/"x"`` matches
+    ``"x"``, If-Match the strong one.
+    """
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if weak and tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def conditional_response(content, etag: str, if_none_match: Optional[str],
+                         headers: Optional[dict] = None) -> Response:
+    """304 if the client already holds this version, the content
+    otherwise, with the ETag in both cases."""
+    headers = {**(headers or {}), 'ETag': etag}
+    if etag_matches(if_none_match, etag, weak=True):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content, headers=headers)
+
+
+def if_match_version(if_match: Optional[str], document_id) -> Optional[int]:
+    """Version an If-Match header requires the document to be at, None
+    when any version will do.
+
+    ``If-Match`` takes the ETag of the full document, as returned by the
+    detail endpoint. Any other ETag can never match: 412.
+    """
+    if if_match is None or if_match.strip() == '*':
+        return None
+    for tag in if_match.split(','):
+        match = FULL_ETAG.fullmatch(tag.strip())
+        if match and match.group(1) == str(document_id):
+            return int(match.group(2))
+    raise HTTPException(status_code=412, detail="Precondition failed")
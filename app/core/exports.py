@@ -0,0 +1,92 @@
+"""Accounting export of the invoice lines."""
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from beanie import PydanticObjectId
+
+from app.core.documents import Customer, Invoice
+
+
+EXPORT_BATCH_SIZE = 500
+
+INVOICE_LINE_FIELDS = [
+    'reference', 'emited', 'customer_id', 'customer', 'title', 'quantity',
+    'unit_price', 'vat', 'total', 'invoice_total_without_charge',
+]
+
+
+def customer_name(customer: dict) -> str:
+    if customer.get('name'):
+        return customer['name']
+    names = (customer.get('first_name'), customer.get('last_name'))
+    return ' '.join(name for name in names if name)
+
+
+async def _customer_names(ids, known: dict):
+    missing = [i for i in ids if i not in known]
+    if missing:
+        cursor = Customer.get_motor_collection().find(
+            {'_id': {'$in': missing}},
+            projection={'name': True, 'first_name': True,
+                        'last_name': True})
+        async for customer in cursor:
+            known[customer['_id']] = customer_name(customer)
+    return known
+
+
+def invoice_query(user_id: UUID, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None,
+                  customer: Optional[PydanticObjectId] = None):
+    query = {'issuer': user_id}
+    if start or end:
+        query['emited'] = {}
+    if start:
+        query['emited']['$gte'] = start
+    if end:
+        query['emited']['$lt'] = end
+    if customer:
+        query['customer'] = customer
+    return query
+
+
+async def invoice_line_chunks(query: dict):
+    """Yield lists of rows, one row per prestation, batch after batch.
+
+    Invoices are read in ``emited`` order straight from the Motor cursor
+    and customer names are resolved with one query per batch.
+    """
+    cursor = Invoice.get_motor_collection().find(
+        query, sort=[('emited', 1), ('_id', 1)],
+        batch_size=EXPORT_BATCH_SIZE)
+    names = {}
+    batch = []
+    async for invoice in cursor:
+        batch.append(invoice)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield await _rows(batch, names)
+            batch = []
+    if batch:
+        yield await _rows(batch, names)
+
+
+async def _rows(invoices, names):
+    await _customer_names({invoice['customer'] for invoice in invoices},
+                          names)
+    rows = []
+    for invoice in invoices:
+        for prestation in invoice.get('prestations', []):
+            rows.append({
+                'reference': invoice['reference'],
+                'emited': invoice['emited'],
+                'customer_id': str(invoice['customer']),
+                'customer': names.get(invoice['customer']),
+                'title': prestation['title'],
+                'quantity': prestation['quantity'],
+                'unit_price': prestation['unit_price'],
+                'vat': prestation.get('vat'),
+                'total': prestation.get('total'),
+                'invoice_total_without_charge':
+                    invoice.get('total_without_charge'),
+            })
+    return rows
@@ -0,0 +1,66 @@
+"""Sparse field selection, turned into a Mongo projection."""
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Query
+
+from app.core.etags import document_etag
+
+
+class FieldSelection:
+    """``fields`` query parameter of the list and detail endpoints."""
+
+    def __init__(self,
+                 fields: Optional[str] = Query(
+                     None, description="Comma separated fields to return, "
+                                       "e.g. `reference,emited`. `_id` is "
+                                       "always returned")):
+        self.fields = [field.strip() for field in (fields or '').split(',')
+                       if field.strip()]
+
+    def projection(self, document_cls) -> Optional[Dict[str, bool]]:
+        """Projection of the selected fields, or None to return them all.
+
+        Names are checked against the document model, so a typo answers
+        400 instead of silently returning nothing.
+        """
+        if not self.fields:
+            return None
+        aliases = {}
+        for name, field in document_cls.__fields__.items():
+            aliases[name] = aliases[field.alias] = field.alias
+        projection = {}
+        unknown = []
+        for field in self.fields:
+            head, _, rest = field.partition('.')
+            if head not in aliases:
+                unknown.append(field)
+                continue
+            path = aliases[head] + ('.' + rest if rest else '')
+            projection[path] = True
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}")
+        return projection
+
+
+def restrict(document: dict, projection: Dict[str, bool]) -> dict:
+    """Drop the fields fetched for internal use but not selected."""
+    kept = {path.split('.')[0] for path in projection} | {'_id'}
+    return {key: value for key, value in document.items() if key in kept}
+
+
+async def find_one_projected(document_cls, document_id,
+                             projection: Dict[str, bool], owner_field: str,
+                             owner) -> Tuple[dict, str]:
+    """Fetch the selected fields of a document owned by ``owner``, and
+    their ETag."""
+    document = await document_cls.get_motor_collection().find_one(
+        {'_id': document_id},
+        {**projection, owner_field: True, 'version': True})
+    if not document:
+        raise HTTPException(status_code=404, detail="Not found")
+    if document.get(owner_field) != owner:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return (restrict(document, projection),
+            document_etag(document, projection))
@@ -0,0 +1,95 @@
+"""Startup reconciliation of the indexes declared on documents.
+
+Each document lists the indexes its queries rely on in
+``Collection.declared_indexes``. Beanie is initialised with index dropping
+disabled and left out of index management, because it aborts the startup
+on the first index whose options differ from the declaration. Here missing
+indexes are created and drifted ones are only reported, so that fixing
+them stays a deliberate operation.
+"""
+import logging
+from typing import Any, Dict, List, Type, Union
+
+from beanie.odm.utils.general import get_model
+from pydantic import BaseModel
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+COMPARED_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds',
+                    'partialFilterExpression', 'collation')
+
+
+class IndexReport(BaseModel):
+    collection: str
+    created: List[str] = []
+    drifted: List[str] = []
+    failed: List[str] = []
+    undeclared: List[str] = []
+
+
+def declared_indexes(document_model) -> List[IndexModel]:
+    collection_class = getattr(document_model, 'Collection', None)
+    return list(getattr(collection_class, 'declared_indexes', []))
+
+
+def _options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    options = {key: spec[key] for key in COMPARED_OPTIONS if key in spec}
+    if not options.get('unique'):
+        options.pop('unique', None)
+    if not options.get('sparse'):
+        options.pop('sparse', None)
+    return options
+
+
+async def reconcile_collection(document_model) -> IndexReport:
+    collection = document_model.get_motor_collection()
+    report = IndexReport(collection=collection.name)
+    existing = await collection.index_information()
+    by_key = {tuple(info['key']): (name, info)
+              for name, info in existing.items()}
+    expected_names = {'_id_'}
+    for index in declared_indexes(document_model):
+        spec = index.document
+        key = tuple(spec['key'].items())
+        name = spec['name']
+        if key in by_key:
+            current_name, info = by_key[key]
+            expected_names.add(current_name)
+            if _options(info) != _options(spec):
+                report.drifted.append(current_name)
+                logger.warning(
+                    "Index %s on %s differs from its declaration: "
+                    "%s != %s", current_name, collection.name,
+                    _options(info), _options(spec))
+            continue
+        expected_names.add(name)
+        if name in existing:
+            report.drifted.append(name)
+            logger.warning("Index %s on %s exists with key %s instead of %s",
+                           name, collection.name, existing[name]['key'],
+                           list(key))
+            continue
+        try:
+            await collection.create_indexes([index])
+        except OperationFailure as e:
+            report.failed.append(name)
+            logger.error("Unable to create index %s on %s: %s",
+                         name, collection.name, e)
+        else:
+            report.created.append(name)
+            logger.info("Created index %s on %s", name, collection.name)
+    report.undeclared = sorted(set(existing) - expected_names)
+    return report
+
+
+async def reconcile_indexes(
+        document_models: List[Union[str, Type]]) -> List[IndexReport]:
+    reports = []
+    for document_model in document_models:
+        if isinstance(document_model, str):
+            document_model = get_model(document_model)
+        reports.append(await reconcile_collection(document_model))
+    return reports
@@ -0,0 +1,310 @@
+"""Durable PDF rendering queue.
+
+Jobs are stored in the ``pdf_jobs`` collection and claimed atomically by
+the ``PdfWorker`` of each API process, which runs the LaTeX build and the
+S3 upload in a process pool so the event loop never blocks on them.
+Failed jobs are retried with an exponential backoff, and jobs left
+``running`` by a process that died are queued again once they time out.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from pymongo import ReturnDocument
+
+from app import settings
+from app.core.background_tasks import render_pdf
+from app.core.documents import Customer, Invoice, PdfJob, Quotation
+from app.core.links import forget_link
+from app.core.models import Issuer, JobStatus
+from app.core.pdf_cache import cache_hits, cache_misses, render_hash
+from app.core.utils import object_exists_async, s3_requests
+from app.metrics import gauge, histogram
+
+
+logger = logging.getLogger(__name__)
+
+render_durations = histogram(
+    'pdf_render_duration_seconds', "Time spent building a PDF with LaTeX",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+
+
+async def queued_jobs():
+    return await PdfJob.get_motor_collection().count_documents(
+        {'status': JobStatus.queued.value})
+
+
+def running_jobs():
+    worker = PdfWorker.instance
+    return len(worker.tasks) if worker else 0
+
+
+gauge('pdf_jobs_queued', "PDF jobs waiting in the queue", queued_jobs)
+gauge('pdf_jobs_running', "PDF jobs rendered by this process", running_jobs)
+
+DOCUMENT_KINDS = {
+    Invoice.Collection.name: Invoice,
+    Quotation.Collection.name: Quotation,
+}
+
+
+async def enqueue_pdf_job(document, user_id: UUID) -> PdfJob:
+    """Queue the rendering of a document, unless one is already queued."""
+    kind = document.Collection.name
+    job = await PdfJob.find_one({'document': document.id,
+                                 'status': JobStatus.queued.value})
+    if not job:
+        job = await PdfJob(user=user_id, kind=kind,
+                           document=document.id).create()
+    worker = PdfWorker.instance
+    if worker:
+        worker.wake()
+    return job
+
+
+async def enqueue_pdf_jobs(documents, user_id: UUID):
+    """Queue the rendering of newly created documents in one insert."""
+    if not documents:
+        return []
+    jobs = [PdfJob(user=user_id, kind=document.Collection.name,
+                   document=document.id) for document in documents]
+    result = await PdfJob.get_motor_collection().insert_many(
+        [job.dict(by_alias=True, exclude={'id'}) for job in jobs])
+    worker = PdfWorker.instance
+    if worker:
+        worker.wake()
+    return result.inserted_ids
+
+
+async def wait_for_jobs(job_ids, timeout: float, interval: float = 0.5):
+    """Wait until the jobs are done or failed, or the timeout expires."""
+    pending = {'_id': {'$in': list(job_ids)},
+               'status': {'$in': [JobStatus.queued.value,
+                                  JobStatus.running.value]}}
+    deadline = asyncio.get_running_loop().time() + timeout
+    while await PdfJob.get_motor_collection().count_documents(pending):
+        if asyncio.get_running_loop().time() >= deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+def claim_query(job: PdfJob) -> dict:
+    """Matches the job as long as it is still in the claim of ``job``: not
+    once it was requeued as stalled, whether claimed again or not."""
+    return {'_id': job.id, 'status': JobStatus.running.value,
+            'attempts': job.attempts}
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(
+        seconds=settings.PDF_JOB_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+class PdfWorker:
+    """Claim queued jobs and render them in a pool of processes."""
+
+    instance = None
+
+    def __init__(self, db, workers=None, jobs_per_user=None):
+        self.db = db
+        self.workers = workers or settings.PDF_WORKERS
+        self.jobs_per_user = jobs_per_user or settings.PDF_JOBS_PER_USER
+        self.tasks = set()
+        self.executor = None
+        self._loop_task = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def collection(self):
+        return PdfJob.get_motor_collection()
+
+    async def start(self):
+        context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=context)
+        await self.requeue_stalled_jobs()
+        self._loop_task = asyncio.create_task(self.run())
+        PdfWorker.instance = self
+
+    async def stop(self, timeout=None):
+        """Stop claiming jobs and wait for the running ones.
+
+        Jobs still running after ``timeout`` seconds are cancelled and
+        queued again, so another process renders them. The rendering
+        processes are terminated first: a render left running would still
+        upload its PDF once the job was handed to someone else.
+        """
+        timeout = settings.PDF_DRAIN_TIMEOUT if timeout is None else timeout
+        self._stopping = True
+        self.wake()
+        if self._loop_task:
+            await self._loop_task
+        if self.tasks:
+            logger.info("Waiting for %s PDF jobs", len(self.tasks))
+            _, pending = await asyncio.wait(self.tasks, timeout=timeout)
+            if pending:
+                self.terminate_pool()
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        PdfWorker.instance = None
+
+    def terminate_pool(self):
+        # ProcessPoolExecutor has no public way to stop a running call.
+        processes = getattr(self.executor, '_processes', None) or {}
+        for process in list(processes.values()):
+            process.terminate()
+
+    def wake(self):
+        self._wake.set()
+
+    async def requeue_stalled_jobs(self):
+        limit = datetime.now() - timedelta(seconds=settings.PDF_JOB_TIMEOUT)
+        result = await self.collection.update_many(
+            {'status': JobStatus.running.value, 'started': {'$lt': limit}},
+            {'$set': {'status': JobStatus.queued.value,
+                      'available_at': datetime.now()}})
+        if result.modified_count:
+            logger.warning("Requeued %s stalled PDF jobs",
+                           result.modified_count)
+
+    async def busy_users(self):
+        """Users at their limit of running jobs, counted over every
+        process rendering PDFs."""
+        rows = await self.collection.aggregate([
+            {'$match': {'status': JobStatus.running.value}},
+            {'$group': {'_id': '$user', 'running': {'$sum': 1}}},
+            {'$match': {'running': {'$gte': self.jobs_per_user}}},
+        ]).to_list(None)
+        return [row['_id'] for row in rows]
+
+    async def claim(self):
+        busy = await self.busy_users()
+        now = datetime.now()
+        job = await self.collection.find_one_and_update(
+            {'status': JobStatus.queued.value,
+             'available_at': {'$lte': now},
+             'user': {'$nin': busy}},
+            {'$set': {'status': JobStatus.running.value, 'started': now},
+             '$inc': {'attempts': 1}},
+            sort=[('available_at', 1)],
+            return_document=ReturnDocument.AFTER)
+        return PdfJob.parse_obj(job) if job else None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # Jobs of a process that crashed are queued again by the others.
+        next_requeue = loop.time() + settings.PDF_JOB_TIMEOUT
+        while not self._stopping:
+            if loop.time() >= next_requeue:
+                next_requeue = loop.time() + settings.PDF_JOB_TIMEOUT
+                try:
+                    await self.requeue_stalled_jobs()
+                except Exception:
+                    logger.exception("Unable to requeue stalled PDF jobs")
+            job = None
+            if len(self.tasks) < self.workers:
+                try:
+                    job = await self.claim()
+                except Exception:
+                    logger.exception("Unable to claim a PDF job")
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(),
+                        timeout=settings.PDF_QUEUE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self.process(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def render(self, job: PdfJob):
+        document = await DOCUMENT_KINDS[job.kind].get(job.document)
+        if not document:
+            raise LookupError(f"{job.kind} {job.document} does not exist")
+        customer = await Customer.get(document.customer)
+        user = await self.db['users'].find_one({'id': job.user})
+        issuer = Issuer(**user).dict()
+        if job.kind == Quotation.Collection.name:
+            issuer['rib'] = None
+        invoice_data, customer_data = document.dict(), customer.dict()
+        content_hash = render_hash(invoice_data, issuer, customer_data)
+        loop = asyncio.get_running_loop()
+        if document.filename and document.render_hash == content_hash:
+            if await object_exists_async(document.filename + '.pdf'):
+                cache_hits.inc()
+                return None
+        cache_misses.inc()
+        filename, render_time, upload_time = await loop.run_in_executor(
+            self.executor, render_pdf, invoice_data, issuer,
+            customer_data, document.filename)
+        render_durations.observe(render_time, kind=job.kind)
+        s3_requests.observe(upload_time, operation='upload')
+        await document.get_motor_collection().update_one(
+            {'_id': document.id},
+            {'$set': {'filename': filename, 'render_hash': content_hash},
+             '$inc': {'version': 1}})
+        forget_link(type(document), document.id)
+        return render_time
+
+    async def process(self, job: PdfJob):
+        try:
+            render_time = await asyncio.wait_for(
+                self.render(job), settings.PDF_JOB_TIMEOUT / 2)
+        except asyncio.CancelledError:
+            await self.requeue(job)
+            raise
+        except asyncio.TimeoutError:
+            logger.error("PDF job %s timed out", job.id)
+            await self.retry_or_fail(job, TimeoutError(
+                f"render longer than {settings.PDF_JOB_TIMEOUT / 2:g}s"))
+        except Exception as e:
+            logger.exception("PDF job %s failed", job.id)
+            await self.retry_or_fail(job, e)
+        else:
+            await self.finish(job, {
+                'status': JobStatus.done.value, 'error': None,
+                'finished': datetime.now(), 'render_time': render_time,
+                'cached': render_time is None})
+        finally:
+            self.wake()
+
+    async def finish(self, job: PdfJob, update: dict):
+        """Record the outcome of this claim of the job, unless the job was
+        requeued as stalled meanwhile: its new claim owns it now."""
+        result = await self.collection.update_one(
+            claim_query(job), {'$set': update})
+        if not result.modified_count:
+            logger.warning("PDF job %s was claimed again, outcome dropped",
+                           job.id)
+
+    async def requeue(self, job: PdfJob):
+        """Queue a job interrupted by the shutdown, without counting the
+        attempt."""
+        logger.warning("PDF job %s interrupted, queued again", job.id)
+        await self.collection.update_one(
+            claim_query(job),
+            {'$set': {'status': JobStatus.queued.value,
+                      'available_at': datetime.now()},
+             '$inc': {'attempts': -1}})
+
+    async def retry_or_fail(self, job: PdfJob, error: Exception):
+        update = {'error': f"{type(error).__name__}: {error}"}
+        if job.attempts < settings.PDF_JOB_MAX_ATTEMPTS:
+            update['status'] = JobStatus.queued.value
+            update['available_at'] = datetime.now() + retry_delay(
+                job.attempts)
+        else:
+            update['status'] = JobStatus.failed.value
+            update['finished'] = datetime.now()
+        await self.finish(job, update)
@@ -0,0 +1,154 @@
+"""LaTeX render engine of the PDF worker processes.
+
+Loading the document class and the packages of the template takes most
+of a pdflatex run, and it is the same work for every document. The
+preamble is dumped once per template version into a format file with
+``mylatexformat``, then every render starts pdflatex from that format,
+which skips the preamble of the document. Each render runs in its own
+scratch directory, on tmpfs when available, removed once the PDF is
+uploaded.
+
+Only imported by the worker processes, it pulls in ``invoice_generator``.
+"""
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from invoice_generator.invoice_generator import InvoiceGenerator
+
+from app import settings
+from app.core.pdf_cache import template_version
+
+
+logger = logging.getLogger(__name__)
+
+BEGIN_DOCUMENT = r'\begin{document}'
+
+# Format file of each template version, None when it cannot be used.
+_formats: Dict[str, Optional[Path]] = {}
+
+
+@contextmanager
+def scratch_directory():
+    """Directory of a single render, removed afterwards."""
+    with tempfile.TemporaryDirectory(prefix='render-',
+                                     dir=settings.LATEX_SCRATCH_DIR) as path:
+        yield Path(path)
+
+
+def preamble(template_dir: Path) -> Optional[str]:
+    """Preamble of the template, None if it depends on the document."""
+    source = (template_dir / 'base.tex').read_text()
+    head, found, _ = source.partition(BEGIN_DOCUMENT)
+    if not found or r'\VAR{' in head or r'\BLOCK{' in head:
+        return None
+    return head
+
+
+def build_format(template_dir: Path, path: Path):
+    """Dump the preamble of the template into the format file ``path``."""
+    head = preamble(template_dir)
+    if head is None:
+        raise ValueError("The preamble of the template is not static")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with scratch_directory() as scratch:
+        source = scratch / 'preamble.tex'
+        source.write_text(f'{head}{BEGIN_DOCUMENT}\n\\end{{document}}\n')
+        result = subprocess.run(
+            ['pdflatex', '-ini', '-interaction=nonstopmode',
+             f'-jobname={path.stem}', '-output-directory', str(scratch),
+             '&pdflatex', 'mylatexformat.ltx', str(source)],
+            cwd=template_dir, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, timeout=settings.PDF_RENDER_TIMEOUT)
+        built = scratch / path.name
+        if result.returncode or not built.exists():
+            raise ValueError(f"Unable to build {path.name}: "
+                             f"{result.stdout.decode(errors='replace')}")
+        # The scratch directory may be on another file system and other
+        # workers may be building the same format: copy, then rename.
+        partial = path.with_name(f'{path.name}.{os.getpid()}')
+        shutil.move(str(built), str(partial))
+        os.replace(partial, path)
+
+
+def get_format(template_dir: Path) -> Optional[Path]:
+    """Format file of the current template version, built on first use."""
+    version = template_version()
+    if version not in _formats:
+        name = 'invoice-' + re.sub(r'[^\w-]', '_', version)
+        path = settings.LATEX_FORMAT_DIR / f'{name}.fmt'
+        if not path.exists():
+            try:
+                build_format(template_dir, path)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                logger.exception("Unable to precompile the preamble, "
+                                 "rendering without format file")
+                path = None
+        _formats[version] = path
+    return _formats[version]
+
+
+class Renderer(InvoiceGenerator):
+    """``InvoiceGenerator`` starting pdflatex from a format file."""
+
+    def __init__(self, data, output_directory, invoice_name=None,
+                 format_file: Optional[Path] = None):
+        super().__init__(data, output_directory=output_directory,
+                         invoice_name=invoice_name)
+        self.format_file = format_file
+
+    def _compile_latex(self):
+        command = ['pdflatex', '-interaction=nonstopmode',
+                   '-output-directory', str(self.output_directory)]
+        env = None
+        if self.format_file:
+            command.append(f'-fmt={self.format_file.stem}')
+            env = {**os.environ,
+                   'TEXFORMATS': f'{self.format_file.parent}:'}
+        command.append(str(self._file_to_compile))
+        result = subprocess.run(command, cwd=self.template_dir, env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                timeout=settings.PDF_RENDER_TIMEOUT)
+        if b'Output written on' not in result.stdout:
+            raise ValueError('Compilation failed')
+        return self
+
+    def run(self) -> Path:
+        # Nothing to clean, the whole scratch directory is removed.
+        return super().run(clean=False)
+
+
+def render_invoice(data, output_directory: Path, invoice_name=None,
+                   use_format=None) -> Renderer:
+    """Compile the PDF of ``data`` in ``output_directory``.
+
+    The format file is used unless ``use_format`` or the LATEX_FORMAT
+    setting is false. A format file pdflatex cannot load, e.g. after a TeX
+    upgrade, is deleted so the next worker process builds it again.
+    A pdflatex run longer than PDF_RENDER_TIMEOUT is killed and raises
+    ``subprocess.TimeoutExpired``, without a second try.
+    """
+    if use_format is None:
+        use_format = settings.LATEX_FORMAT
+    renderer = Renderer(data, output_directory, invoice_name)
+    if use_format:
+        renderer.format_file = get_format(renderer.template_dir)
+    try:
+        renderer.run()
+    except ValueError:
+        if renderer.format_file is None:
+            raise
+        format_file, renderer.format_file = renderer.format_file, None
+        renderer.run()
+        logger.warning("pdflatex could not use %s, deleted it",
+                       format_file.name)
+        _formats[template_version()] = None
+        format_file.unlink(missing_ok=True)
+    return renderer
@@ -0,0 +1,71 @@
+"""Public links to the PDF of invoices and quotations.
+
+A presigned URL is computed locally and stays valid for
+PUBLIC_LINK_EXPIRATION seconds, which is also the TTL of the ``s3_links``
+collection. Links are served from an in-process cache until they are
+PUBLIC_LINK_REFRESH_MARGIN seconds away from expiring, then a new one is
+signed, so clients never receive a link about to die. The cache of a
+process is not told about the renders of the others: with several server
+processes, entries last PUBLIC_LINK_CACHE_TTL seconds.
+
+The ETag of a link changes with the link and with the render hash of the
+PDF, so a client polling the link learns when the PDF was regenerated.
+"""
+from datetime import datetime, timedelta
+from typing import Tuple
+
+from fastapi import HTTPException
+
+from app import settings
+from app.cache import TTLCache
+from app.core.documents import S3Link
+from app.core.etags import make_etag
+from app.core.utils import create_presigned_url_async
+
+
+links = TTLCache(maxsize=settings.PUBLIC_LINK_CACHE_SIZE,
+                 ttl=settings.PUBLIC_LINK_CACHE_TTL)
+
+
+def fresh_for(link: S3Link) -> float:
+    """Seconds during which the link can still be handed out."""
+    lifetime = timedelta(seconds=settings.PUBLIC_LINK_EXPIRATION
+                         - settings.PUBLIC_LINK_REFRESH_MARGIN)
+    return (link.created + lifetime - datetime.now()).total_seconds()
+
+
+def forget_link(document_cls, document_id):
+    """Drop the cached link, e.g. once the PDF was rendered again."""
+    links.pop((document_cls.Collection.name, document_id))
+
+
+async def get_document_link(document_cls, document_id) -> Tuple[S3Link, str]:
+    """Return the public link of a document and its ETag."""
+    key = (document_cls.Collection.name, document_id)
+    cached = links.get(key)
+    if cached:
+        return cached
+    # The filename and the stored links are read in a single round-trip.
+    rows = await document_cls.aggregate([
+        {'$match': {'_id': document_id}},
+        {'$project': {'filename': True, 'render_hash': True}},
+        {'$lookup': {'from': S3Link.Collection.name,
+                     'localField': '_id',
+                     'foreignField': 'document',
+                     'as': 'links'}},
+    ]).to_list()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not rows[0].get('filename'):
+        raise HTTPException(status_code=404, detail="PDF not generated")
+    stored = [S3Link.parse_obj(link) for link in rows[0]['links']]
+    link = max(stored, key=lambda link: link.created, default=None)
+    if not link or fresh_for(link) <= 0:
+        public_url = await create_presigned_url_async(
+            rows[0]['filename'] + '.pdf',
+            expiration=settings.PUBLIC_LINK_EXPIRATION)
+        link = await S3Link(document=document_id, url=public_url).create()
+    etag = make_etag(link.id, rows[0].get('render_hash'))
+    links.set(key, (link, etag),
+              ttl=min(fresh_for(link), settings.PUBLIC_LINK_CACHE_TTL))
+    return link, etag
@@ -0,0 +1,57 @@
+"""Sending the PDF of an invoice to its customer."""
+import base64
+
+from fastapi import HTTPException
+
+from app import mail, settings
+from app.core.documents import Customer, Invoice
+from app.core.models import DocumentMailSchema
+from app.core.utils import (create_presigned_url_async,
+                            get_object_body_async, run_in_s3_executor)
+from app.users.models import UserDB
+
+
+async def read_pdf(filename: str) -> bytes:
+    body = await get_object_body_async(filename + '.pdf')
+    if body is None:
+        raise HTTPException(status_code=404, detail="PDF not generated")
+    try:
+        return await run_in_s3_executor(body.read)
+    finally:
+        body.close()
+
+
+async def send_invoice(invoice: Invoice, user: UserDB,
+                       payload: DocumentMailSchema):
+    """Queue an email carrying the PDF, attached or as a link."""
+    if not invoice.filename:
+        raise HTTPException(status_code=404, detail="PDF not generated")
+    to = payload.to
+    if not to:
+        customer = await Customer.get(invoice.customer)
+        to = customer.email if customer else None
+    if not to:
+        raise HTTPException(status_code=400,
+                            detail="Customer has no email address")
+    subject = payload.subject or \
+        f"Facture {invoice.reference} - {user.company_name}"
+    attachments = None
+    if payload.attach:
+        data = await read_pdf(invoice.filename)
+        attachments = [{'content': base64.b64encode(data).decode(),
+                        'type': 'application/pdf',
+                        'filename': f'{invoice.reference}.pdf',
+                        'disposition': 'attachment'}]
+        content = (f"Bonjour,\n\nVeuillez trouver ci-joint la facture "
+                   f"{invoice.reference} de {user.company_name}.\n")
+    else:
+        url = await create_presigned_url_async(
+            invoice.filename + '.pdf',
+            expiration=settings.EMAIL_LINK_EXPIRATION)
+        content = (f"Bonjour,\n\nLa facture {invoice.reference} de "
+                   f"{user.company_name} est disponible à l'adresse :\n"
+                   f"{url}\n")
+    if payload.message:
+        content += f"\n{payload.message}\n"
+    await mail.send([mail.recipient(to)], subject, content,
+                    attachments=attachments, reply_to=user.email)
@@ -0,0 +1,137 @@
+"""Data migrations, run through ``manage.py``."""
+import logging
+
+from pymongo import UpdateOne
+
+from app import settings
+from app.core import stats
+from app.core.documents import Customer, Invoice, Quotation, ReferenceCounter
+from app.core.indexes import reconcile_collection
+from app.core.models import Prestation
+from app.core.money import totals
+from app.core.sequences import counter_kind, parse_reference
+from app.core.utils import customer_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+async def seed_reference_counters():
+    """Initialise the reference counters from the existing documents.
+
+    The counter of a user, document type and year is raised to the highest
+    trailing number found in the matching references, and takes the
+    numbering scheme of that reference. ``$max`` is used so running the
+    migration again never moves a counter backwards.
+    """
+    operations = []
+    for document_cls in (Invoice, Quotation):
+        highest = {}
+        cursor = document_cls.get_motor_collection().find(
+            {}, projection={'issuer': True, 'reference': True,
+                            'emited': True})
+        async for document in cursor:
+            parsed = parse_reference(document.get('reference'),
+                                     document['emited'].year)
+            if not parsed:
+                continue
+            key = (document['issuer'], parsed.year)
+            if key not in highest or parsed.number > highest[key].number:
+                highest[key] = parsed
+        kind = counter_kind(document_cls)
+        operations += [
+            UpdateOne({'user': user, 'kind': kind, 'year': year},
+                      {'$max': {'value': parsed.number},
+                       '$set': {'prefix': parsed.prefix,
+                                'width': parsed.width}}, upsert=True)
+            for (user, year), parsed in highest.items()
+        ]
+    if operations:
+        await ReferenceCounter.get_motor_collection().bulk_write(
+            operations, ordered=False)
+    logger.info("Seeded %s reference counters", len(operations))
+    return len(operations)
+
+
+def missing_fields(customer: dict, duplicate: dict) -> dict:
+    """Fields set on a duplicate but empty on the customer it merges
+    into, e.g. a phone number given only once."""
+    return {field: value for field, value in duplicate.items()
+            if value not in (None, '') and customer.get(field) in (None, '')
+            and field not in ('_id', 'fingerprint', 'version')}
+
+
+async def deduplicate_customers():
+    """Fingerprint every customer and merge the duplicates.
+
+    The oldest customer of each fingerprint is kept and gets the fields it
+    lacks from the others. Invoices and quotations of the others are moved
+    to it before they are deleted. The unique fingerprint index, which
+    cannot be built while duplicates exist, is created at the end.
+    """
+    collection = Customer.get_motor_collection()
+    kept = {}
+    duplicates = {}
+    updates = {}
+    async for customer in collection.find({}, sort=[('_id', 1)]):
+        fingerprint = customer_fingerprint(customer)
+        if fingerprint in kept:
+            original = kept[fingerprint]
+            duplicates[customer['_id']] = original['_id']
+            fields = missing_fields(original, customer)
+            original.update(fields)
+            updates.setdefault(original['_id'], {}).update(fields)
+            continue
+        kept[fingerprint] = customer
+        if customer.get('fingerprint') != fingerprint:
+            updates[customer['_id']] = {'fingerprint': fingerprint}
+    fingerprints = [UpdateOne({'_id': customer_id},
+                              {'$set': fields, '$inc': {'version': 1}})
+                    for customer_id, fields in updates.items() if fields]
+    merged = {}
+    for duplicate, original in duplicates.items():
+        merged.setdefault(original, []).append(duplicate)
+    for original, others in merged.items():
+        for document_cls in (Invoice, Quotation):
+            await document_cls.get_motor_collection().update_many(
+                {'customer': {'$in': others}},
+                {'$set': {'customer': original}, '$inc': {'version': 1}})
+    if duplicates:
+        await collection.delete_many({'_id': {'$in': list(duplicates)}})
+    if fingerprints:
+        await collection.bulk_write(fingerprints, ordered=False)
+    await reconcile_collection(Customer)
+    logger.info("Updated %s customers, merged %s duplicates",
+                len(fingerprints), len(duplicates))
+    return len(duplicates)
+
+
+async def store_amounts_in_cents():
+    """Compute the amounts in cents and the VAT breakdown of the invoices
+    and quotations written before they existed, then rebuild the
+    statistics and the revenue from them.
+    """
+    updated = 0
+    for document_cls in (Invoice, Quotation):
+        collection = document_cls.get_motor_collection()
+        operations = []
+        cursor = collection.find({'total_cents': {'$exists': False}},
+                                 projection={'prestations': True})
+        async for document in cursor:
+            prestations = [Prestation(**prestation).dict()
+                           for prestation in document['prestations']]
+            operations.append(UpdateOne(
+                {'_id': document['_id']},
+                {'$set': {'prestations': prestations, **totals(prestations)},
+                 '$inc': {'version': 1}}))
+            if len(operations) == settings.BULK_BATCH_SIZE:
+                await collection.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+    await stats.rebuild_prestation_stats()
+    await stats.rebuild_revenue()
+    logger.info("Stored the amounts in cents of %s documents", updated)
+    return updated
@@ -1,13 +1,29 @@
 from typing import Optional, List
 from datetime import datetime
+from enum import Enum
 from beanie import PydanticObjectId
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import (BaseModel, EmailStr, Field, confloat, conlist,
+                      validator)
+
+from app import settings
+from app.core.money import line_cents, to_cents, to_euros
 
 
 class Message(BaseModel):
     message: str
 
 
+class JobAccepted(Message):
+    job: PydanticObjectId
+
+
+class JobStatus(str, Enum):
+    queued = 'queued'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+
 class Address(BaseModel):
     address: str
     zip_code: int
@@ -30,16 +46,48 @@ class CustomerIn(BaseModel):
     phone: Optional[str]
 
 
+# Bounds keeping every line, and the sum of thousands of them, within the
+# 64-bit integers of MongoDB once in cents.
+MAX_UNIT_PRICE = 10 ** 7
+MAX_QUANTITY = 10 ** 6
+
+
 class Prestation(BaseModel):
     title: str
-    unit_price: float
-    quantity: float
-    vat: float = 0.0
+    unit_price: confloat(ge=-MAX_UNIT_PRICE, le=MAX_UNIT_PRICE)
+    quantity: confloat(ge=-MAX_QUANTITY, le=MAX_QUANTITY)
+    vat: confloat(ge=0, le=100) = 0.0
+    unit_price_cents: int = None
+    total_cents: int = None
     total: float = None
 
+    # A field that failed validation is missing from ``values``, its error
+    # is reported instead.
+
+    @validator('unit_price_cents', always=True, pre=True)
+    def compute_unit_price_cents(cls, v, values):
+        if 'unit_price' not in values:
+            return v
+        return to_cents(values['unit_price'])
+
+    @validator('total_cents', always=True, pre=True)
+    def compute_total_cents(cls, v, values):
+        if values.get('unit_price_cents') is None \
+                or 'quantity' not in values:
+            return v
+        return line_cents(values['unit_price_cents'], values['quantity'])
+
     @validator('total', always=True, pre=True)
     def compute_total(cls, v, values):
-        return values['quantity'] * values['unit_price']
+        if values.get('total_cents') is None:
+            return v
+        return to_euros(values['total_cents'])
+
+
+class VatRate(BaseModel):
+    rate: float
+    base_cents: int
+    vat_cents: int
 
 
 class Issuer(BaseModel):
@@ -58,10 +106,29 @@ class PrestationsAggregation(BaseModel):
     title: str = Field(None, alias='_id')
     total_unit: int
     total_without_charge: float
+    total_without_charge_cents: int
     min_price: float
     max_price: float
 
 
+class RevenuePeriod(BaseModel):
+    period: str
+    invoices: int
+    total_without_charge: float
+    total_vat: float
+    total: float
+
+
+class RevenueReport(BaseModel):
+    year: int
+    months: List[RevenuePeriod]
+    quarters: List[RevenuePeriod]
+    total: RevenuePeriod
+    year_to_date: float
+    ceiling: float
+    ceiling_share: float
+
+
 class InvoiceCreateSchema(BaseModel):
     reference: Optional[str]
     emited:  Optional[datetime] = None
@@ -73,12 +140,34 @@ class InvoiceCreateSchema(BaseModel):
         return v or datetime.now()
 
 
+class BulkCreateSchema(BaseModel):
+    items: conlist(InvoiceCreateSchema, min_items=1,
+                   max_items=settings.BULK_MAX_ITEMS)
+    ordered: bool = True
+    generate_pdf: bool = False
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[PydanticObjectId]
+    reference: Optional[str]
+    error: Optional[str]
+
+
+class BulkCreateResult(BaseModel):
+    created: int
+    results: List[BulkItemResult]
+
+
+class DocumentMailSchema(BaseModel):
+    to: Optional[EmailStr]
+    subject: Optional[str]
+    message: Optional[str]
+    attach: bool = True
+
+
 class InvoiceUpdateSchema(BaseModel):
     reference: Optional[str]
     emited: Optional[datetime]
     customer: Optional[PydanticObjectId]
     prestations: Optional[List[Prestation]]
-
-
-class InvoiceFilenameProjection(BaseModel):
-    filename: Optional[str]
@@ -0,0 +1,58 @@
+"""Exact money arithmetic.
+
+Amounts are stored as integer cents next to the euro values of the API.
+Prices entered in euros are converted once through ``Decimal``, line
+totals are rounded half up to the cent, and the VAT is computed per rate
+on the sum of the lines at that rate, as printed on the invoice. Totals
+are computed when a document is written, so reads and aggregations only
+add integers.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Union
+
+
+def _round(amount: Decimal) -> int:
+    return int(amount.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_cents(euros: Union[float, int, str, Decimal]) -> int:
+    """Cents of an amount in euros, ``str`` first so ``10.1`` is 1010."""
+    return _round(Decimal(str(euros)) * 100)
+
+
+def to_euros(cents: int) -> float:
+    return cents / 100
+
+
+def line_cents(unit_price_cents: int, quantity: float) -> int:
+    return _round(unit_price_cents * Decimal(str(quantity)))
+
+
+def vat_cents(base_cents: int, rate: float) -> int:
+    return _round(base_cents * Decimal(str(rate)) / 100)
+
+
+def totals(prestations: Iterable) -> Dict:
+    """HT, VAT and TTC totals of the prestations and the VAT per rate.
+
+    Prestations are models or dicts with ``vat`` and ``total_cents``.
+    """
+    bases: Dict[float, int] = {}
+    for prestation in prestations:
+        if isinstance(prestation, dict):
+            rate, cents = prestation['vat'], prestation['total_cents']
+        else:
+            rate, cents = prestation.vat, prestation.total_cents
+        bases[rate] = bases.get(rate, 0) + cents
+    breakdown: List[Dict] = [
+        {'rate': rate, 'base_cents': base, 'vat_cents': vat_cents(base, rate)}
+        for rate, base in sorted(bases.items())]
+    without_charge = sum(bases.values())
+    vat = sum(line['vat_cents'] for line in breakdown)
+    return {
+        'total_without_charge': to_euros(without_charge),
+        'total_without_charge_cents': without_charge,
+        'total_vat_cents': vat,
+        'total_cents': without_charge + vat,
+        'vat_breakdown': breakdown,
+    }
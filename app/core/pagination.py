@@ -0,0 +1,178 @@
+"""Keyset pagination and NDJSON streaming for per-user listings."""
+import base64
+import binascii
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+import pymongo
+from beanie import PydanticObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core import trusted
+from app.core.etags import page_etag
+from app.core.fields import restrict
+from app.responses import dumps
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+class SortOrder(str, Enum):
+    asc = 'asc'
+    desc = 'desc'
+
+
+class PaginationParams:
+    """Query parameters shared by every paginated listing."""
+
+    def __init__(self,
+                 cursor: Optional[str] = Query(
+                     None, description="Opaque cursor returned in the "
+                                       f"`{NEXT_CURSOR_HEADER}` header"),
+                 limit: Optional[int] = Query(
+                     None, ge=1, le=MAX_PAGE_SIZE,
+                     description="Page size. Without a limit or a cursor, "
+                                 "every matching document is returned"),
+                 order: SortOrder = SortOrder.desc,
+                 stream: bool = Query(
+                     False, description="Stream every matching document "
+                                        "as NDJSON instead of one page")):
+        self.cursor = cursor
+        # Listings were not paginated at first: clients that send neither
+        # a limit nor a cursor still receive everything.
+        self.paginated = limit is not None or cursor is not None
+        self.limit = limit or DEFAULT_PAGE_SIZE
+        self.order = order
+        self.stream = stream
+
+
+def encode_cursor(values: List[Any]) -> str:
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'d': value.isoformat()})
+        else:
+            payload.append({'o': str(value)})
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = []
+        for item in payload:
+            if 'd' in item:
+                values.append(datetime.fromisoformat(item['d']))
+            else:
+                values.append(PydanticObjectId(item['o']))
+    except (binascii.Error, InvalidId, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _keyset_filter(keys: List[str], values: List[Any],
+                   order: SortOrder) -> Dict[str, Any]:
+    """Build the "strictly after this key" filter for a compound sort."""
+    operator = '$gt' if order == SortOrder.asc else '$lt'
+    clauses = []
+    for i, key in enumerate(keys):
+        clause = {k: v for k, v in zip(keys[:i], values[:i])}
+        clause[key] = {operator: values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def _sort_keys(sort_field: Optional[str]) -> List[str]:
+    return [sort_field, '_id'] if sort_field else ['_id']
+
+
+def build_query(query: Dict[str, Any], sort_field: Optional[str],
+                params: PaginationParams
+                ) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+    """Return the filter and sort spec for the page described by params."""
+    keys = _sort_keys(sort_field)
+    direction = pymongo.ASCENDING if params.order == SortOrder.asc \
+        else pymongo.DESCENDING
+    sort = [(key, direction) for key in keys]
+    if params.cursor:
+        values = decode_cursor(params.cursor, len(keys))
+        query = {'$and': [query, _keyset_filter(keys, values, params.order)]}
+    return query, sort
+
+
+def _find(document_cls, query: Dict[str, Any],
+          projection: Optional[Dict[str, bool]], sort_field: Optional[str]):
+    """Cursor of raw dicts. With a projection, they only hold the projected
+    fields, the sort keys and the version."""
+    if projection is not None:
+        projection = {**projection, 'version': True,
+                      **{key: True for key in _sort_keys(sort_field)}}
+    return document_cls.get_motor_collection().find(query, projection)
+
+
+def _finish(document_cls, document: dict,
+            projection: Optional[Dict[str, bool]]):
+    if projection is None:
+        return trusted.construct(document_cls, document)
+    return restrict(document, projection)
+
+
+async def paginate(document_cls, query: Dict[str, Any],
+                   params: PaginationParams,
+                   sort_field: Optional[str] = None,
+                   projection: Optional[Dict[str, bool]] = None):
+    """Fetch one page of documents, the cursor of the next one and the
+    ETag of the page. Unless the client asked for pages, the page holds
+    every matching document.
+
+    One extra document is requested to know whether another page exists
+    without running a count. Documents are built without running the
+    validators, see ``app.core.trusted``. With a projection, raw dicts
+    holding only the projected fields are returned instead.
+    """
+    query, sort = build_query(query, sort_field, params)
+    cursor = _find(document_cls, query, projection, sort_field).sort(sort)
+    if params.paginated:
+        cursor = cursor.limit(params.limit + 1)
+    documents = await cursor.to_list(None)
+    next_cursor = None
+    if params.paginated and len(documents) > params.limit:
+        documents = documents[:params.limit]
+        last = documents[-1]
+        keys = _sort_keys(sort_field)
+        next_cursor = encode_cursor([last[key] for key in keys])
+    etag = page_etag(documents, next_cursor, projection)
+    documents = [_finish(document_cls, document, projection)
+                 for document in documents]
+    return documents, next_cursor, etag
+
+
+def stream_ndjson(document_cls, query: Dict[str, Any],
+                  params: PaginationParams,
+                  sort_field: Optional[str] = None,
+                  projection: Optional[Dict[str, bool]] = None
+                  ) -> StreamingResponse:
+    """Stream every matching document, one JSON object per line.
+
+    Documents are encoded as they come off the Motor cursor so memory use
+    does not depend on the size of the collection.
+    """
+    query, sort = build_query(query, sort_field, params)
+
+    async def lines():
+        async for document in _find(document_cls, query, projection,
+                                    sort_field).sort(sort):
+            yield dumps(_finish(document_cls, document, projection)) + b'\n'
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,43 @@
+"""Content hash of everything a rendered PDF depends on.
+
+The hash covers the document as passed to ``invoice_generator``, the
+issuer, the customer and the template version. It is stored on the
+document with the PDF name after each render, so a render whose inputs
+did not change since the last upload can be skipped.
+"""
+import hashlib
+import json
+from importlib import metadata
+
+from app import settings
+from app.metrics import counter
+
+
+cache_hits = counter('pdf_cache_hits_total',
+                     "PDF renders skipped because the uploaded PDF is "
+                     "up to date")
+cache_misses = counter('pdf_cache_misses_total',
+                       "PDF renders that had to run")
+
+IGNORED_FIELDS = {'id', '_id', 'revision_id', 'filename', 'render_hash',
+                  'version', 'user', 'issuer', 'customer'}
+
+
+def template_version():
+    version = metadata.version('french-invoice-generator')
+    if settings.PDF_TEMPLATE_VERSION:
+        version = f'{version}+{settings.PDF_TEMPLATE_VERSION}'
+    return version
+
+
+def render_hash(invoice_data, issuer, customer):
+    payload = {
+        'template': template_version(),
+        'invoice': {k: v for k, v in invoice_data.items()
+                    if k not in IGNORED_FIELDS},
+        'issuer': issuer,
+        'customer': {k: v for k, v in customer.items()
+                     if k not in IGNORED_FIELDS},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
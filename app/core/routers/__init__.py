@@ -4,6 +4,9 @@ from app.core.routers.invoices import get_invoices_router
 from app.core.routers.prestations import get_prestations_router
 from app.core.routers.customers import get_customers_router
 from app.core.routers.quotations import get_quotations_router
+from app.core.routers.jobs import get_jobs_router
+from app.core.routers.exports import get_exports_router
+from app.core.routers.revenue import get_revenue_router
 
 
 def get_core_router(app):
@@ -12,4 +15,7 @@ def get_core_router(app):
     core_router.include_router(get_prestations_router(app))
     core_router.include_router(get_customers_router(app))
     core_router.include_router(get_quotations_router(app))
+    core_router.include_router(get_jobs_router(app))
+    core_router.include_router(get_exports_router(app))
+    core_router.include_router(get_revenue_router(app))
     return core_router
@@ -1,39 +1,65 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
 import pydantic
 from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
 
-from app.responses import UNAUTHORIZED, FORBIDDEN, NOT_FOUND, CONFLICT
+from app.responses import (NOT_MODIFIED, UNAUTHORIZED, FORBIDDEN, NOT_FOUND,
+                           CONFLICT)
 from app.users.models import UserDB
 from app.core.documents import Customer
 from app.core.models import CustomerIn
+from app.core import trusted
+from app.core.etags import conditional_response, document_etag
+from app.core.fields import FieldSelection, find_one_projected
+from app.core.pagination import (NEXT_CURSOR_HEADER, PaginationParams,
+                                 paginate, stream_ndjson)
 
 
 def get_customers_router(app):
 
     router = APIRouter(tags=['customers'], prefix='/customers')
 
-    @router.get('', responses=dict([UNAUTHORIZED]),
+    @router.get('', responses=dict([NOT_MODIFIED, UNAUTHORIZED]),
                 response_model=List[Customer])
     async def get_user_customers(
+                pagination: PaginationParams = Depends(),
+                selection: FieldSelection = Depends(),
+                if_none_match: Optional[str] = Header(None),
                 user: UserDB = Depends(app.current_active_user)
             ):
-        customers = await Customer.find({'user': user.id}).to_list()
-        return customers
+        query = {'user': user.id}
+        projection = selection.projection(Customer)
+        if pagination.stream:
+            return stream_ndjson(Customer, query, pagination,
+                                 projection=projection)
+        customers, next_cursor, etag = await paginate(
+            Customer, query, pagination, projection=projection)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return conditional_response(customers, etag, if_none_match, headers)
 
     @router.get('/{customer_id}',
-                responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND]),
+                responses=dict([NOT_MODIFIED, UNAUTHORIZED, FORBIDDEN,
+                                NOT_FOUND]),
                 response_model=Customer)
     async def get_customer(
                 customer_id: PydanticObjectId,
+                selection: FieldSelection = Depends(),
+                if_none_match: Optional[str] = Header(None),
                 user: UserDB = Depends(app.current_active_user)
             ):
-        customer = await Customer.get(customer_id)
+        projection = selection.projection(Customer)
+        if projection:
+            content, etag = await find_one_projected(
+                Customer, customer_id, projection, 'user', user.id)
+            return conditional_response(content, etag, if_none_match)
+        customer = await trusted.get(Customer, customer_id)
         if not customer:
             raise HTTPException(status_code=404, detail="Not found")
         if customer.user != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        return customer
+        return conditional_response(customer, document_etag(customer),
+                                    if_none_match)
 
     @router.post('', status_code=201,
                  response_model=Customer,
@@ -42,15 +68,12 @@ def get_customers_router(app):
                 customer: CustomerIn,
                 user: UserDB = Depends(app.current_active_user)
             ):
-        customer_dict = customer.dict(exclude_unset=True)
-        customer_dict['user'] = user.id
-        customer_db = await Customer.find_one(customer_dict)
-        if customer_db:
-            raise HTTPException(status_code=409, detail="Already exists")
         try:
             customer = await Customer(**customer.dict(), user=user.id).create()
         except pydantic.error_wrappers.ValidationError as e:
             raise HTTPException(status_code=422, detail=e.errors())
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Already exists")
         return customer
 
     return router
@@ -0,0 +1,69 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from beanie import PydanticObjectId
+
+from app.responses import UNAUTHORIZED
+from app.users.models import UserDB
+from app.core.archives import invoice_pdf_archive
+from app.core.exports import (INVOICE_LINE_FIELDS, invoice_line_chunks,
+                              invoice_query)
+from app.core.streaming import ENCODERS
+
+
+class ExportFormat(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+    xlsx = 'xlsx'
+
+
+def get_exports_router(app):
+
+    router = APIRouter(tags=['exports'], prefix='/exports')
+
+    @router.get('/invoice-lines',
+                response_class=StreamingResponse,
+                summary="Export invoice lines",
+                description="Stream one row per invoiced prestation, "
+                            "emitted in [start, end).",
+                responses=dict([UNAUTHORIZED]))
+    async def export_invoice_lines(
+        format: ExportFormat = ExportFormat.csv,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        customer: Optional[PydanticObjectId] = None,
+        user: UserDB = Depends(app.current_active_user)
+            ):
+        encoder, media_type = ENCODERS[format.value]
+        chunks = invoice_line_chunks(
+            invoice_query(user.id, start, end, customer))
+        filename = f'invoice-lines.{format.value}'
+        return StreamingResponse(
+            encoder(INVOICE_LINE_FIELDS, chunks), media_type=media_type,
+            headers={'Content-Disposition':
+                     f'attachment; filename="{filename}"'})
+
+    @router.get('/invoice-pdfs',
+                response_class=StreamingResponse,
+                summary="Download the PDFs of the invoices as a ZIP",
+                description="Invoices emitted in [start, end). With "
+                            "`render_missing`, invoices without a PDF are "
+                            "rendered first.",
+                responses=dict([UNAUTHORIZED]))
+    async def export_invoice_pdfs(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        customer: Optional[PydanticObjectId] = None,
+        render_missing: bool = False,
+        user: UserDB = Depends(app.current_active_user)
+            ):
+        query = invoice_query(user.id, start, end, customer)
+        return StreamingResponse(
+            invoice_pdf_archive(query, user.id, render_missing),
+            media_type='application/zip',
+            headers={'Content-Disposition':
+                     'attachment; filename="invoices.zip"'})
+
+    return router
@@ -1,16 +1,30 @@
-from typing import List
-from datetime import datetime
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
 
-from app.responses import ACCEPTED, UNAUTHORIZED, FORBIDDEN, NOT_FOUND
+from app.responses import (ACCEPTED, NOT_MODIFIED, UNAUTHORIZED, FORBIDDEN,
+                           NOT_FOUND, CONFLICT, PRECONDITION_FAILED,
+                           MULTI_STATUS, NOTHING_CREATED,
+                           ORJSONResponse)
 from app.users.models import UserDB
-from app.core.documents import Customer, Invoice, S3Link
-from app.core.models import (InvoiceCreateSchema, InvoiceUpdateSchema,
-                             Message, InvoiceFilenameProjection)
-from app.core.utils import increment_reference, create_presigned_url
-from app.core.background_tasks import generate_pdf_invoice
+from app.core.documents import Invoice, S3Link
+from app.core.models import (BulkCreateResult, BulkCreateSchema,
+                             DocumentMailSchema, InvoiceCreateSchema,
+                             InvoiceUpdateSchema, JobAccepted, Message)
+from app.core.bulk import bulk_create, bulk_status
+from app.core.jobs import enqueue_pdf_job, enqueue_pdf_jobs
+from app.core import trusted
+from app.core.etags import (conditional_response, document_etag,
+                            if_match_version)
+from app.core.fields import FieldSelection, find_one_projected
+from app.core.links import get_document_link
+from app.core.mailing import send_invoice
+from app.core.pagination import (NEXT_CURSOR_HEADER, PaginationParams,
+                                 paginate, stream_ndjson)
+from app.core.sequences import next_reference, record_references
+from app.core.stats import invoice_changed, record_invoices
+from app.core.updates import update_document
 
 
 def get_invoices_router(app):
@@ -19,53 +33,92 @@ def get_invoices_router(app):
 
     @router.get('', response_model=List[Invoice],
                 summary="Return user's invoices",
-                description="List all invoices for a specific user",
-                responses=dict([UNAUTHORIZED]))
+                description="List the invoices of a specific user, most "
+                            "recent first, one page at a time",
+                responses=dict([NOT_MODIFIED, UNAUTHORIZED]))
     async def list_user_invoices(
+        pagination: PaginationParams = Depends(),
+        selection: FieldSelection = Depends(),
+        if_none_match: Optional[str] = Header(None),
         user: UserDB = Depends(app.current_active_user)
             ):
-        invoices = await Invoice.find({"issuer": user.id}).to_list()
-        return invoices
+        query = {"issuer": user.id}
+        projection = selection.projection(Invoice)
+        if pagination.stream:
+            return stream_ndjson(Invoice, query, pagination, 'emited',
+                                 projection)
+        invoices, next_cursor, etag = await paginate(
+            Invoice, query, pagination, 'emited', projection)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return conditional_response(invoices, etag, if_none_match, headers)
 
     @router.get('/{invoice_id}', response_model=Invoice,
-                responses=dict([FORBIDDEN, NOT_FOUND]))
+                responses=dict([NOT_MODIFIED, FORBIDDEN, NOT_FOUND]))
     async def get_invoice(invoice_id: PydanticObjectId,
+                          selection: FieldSelection = Depends(),
+                          if_none_match: Optional[str] = Header(None),
                           user: UserDB = Depends(app.current_active_user)):
-        invoice = await Invoice.get(invoice_id)
+        projection = selection.projection(Invoice)
+        if projection:
+            content, etag = await find_one_projected(
+                Invoice, invoice_id, projection, 'issuer', user.id)
+            return conditional_response(content, etag, if_none_match)
+        invoice = await trusted.get(Invoice, invoice_id)
         if not invoice:
             raise HTTPException(status_code=404, detail="Not found")
         if invoice.issuer != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        return invoice
+        return conditional_response(invoice, document_etag(invoice),
+                                    if_none_match)
 
     @router.post('', response_model=Invoice, status_code=201,
-                 responses=dict([(201, {"model": Invoice}), UNAUTHORIZED]))
+                 responses=dict([(201, {"model": Invoice}), UNAUTHORIZED,
+                                 CONFLICT]))
     async def create_invoice(invoice: InvoiceCreateSchema,
                              user: UserDB = Depends(app.current_active_user)):
-        if not invoice.reference:
-            last_invoice = await Invoice.find(Invoice.issuer == user.id)\
-                .sort('-emited').limit(1).to_list()
-            if last_invoice:
-                current_ref = last_invoice[0].reference
-                invoice.reference = increment_reference(current_ref)
-            else:
-                invoice.reference = f"{datetime.now().year}-001"
-        invoice_db = await Invoice(**invoice.dict(), issuer=user.id).create()
+        if invoice.reference:
+            await record_references(
+                Invoice, user.id, [(invoice.reference, invoice.emited.year)])
+        else:
+            invoice.reference = await next_reference(Invoice, user.id,
+                                                     invoice.emited.year)
+        try:
+            invoice_db = await Invoice(**invoice.dict(), issuer=user.id)\
+                .create()
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Already exists")
+        await record_invoices([invoice_db])
         return invoice_db
 
+    @router.post('/bulk', response_model=BulkCreateResult, status_code=201,
+                 summary="Create several invoices",
+                 responses=dict([UNAUTHORIZED, MULTI_STATUS,
+                                 NOTHING_CREATED]))
+    async def bulk_create_invoices(
+        payload: BulkCreateSchema, response: Response,
+        user: UserDB = Depends(app.current_active_user)
+            ):
+        result, created = await bulk_create(Invoice, payload, user.id)
+        await record_invoices(created)
+        if payload.generate_pdf:
+            await enqueue_pdf_jobs(created, user.id)
+        response.status_code = bulk_status(result)
+        return result
+
     @router.patch('', response_model=Invoice,
-                  responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
+                  responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND,
+                                  CONFLICT, PRECONDITION_FAILED]))
     async def update_invoice(invoice_id: PydanticObjectId,
                              invoice: InvoiceUpdateSchema,
+                             if_match: Optional[str] = Header(None),
                              user: UserDB = Depends(app.current_active_user)):
-        invoice_db = await Invoice.get(invoice_id)
-        if not invoice_db:
-            raise HTTPException(status_code=404, detail="Not found")
-        if invoice_db.issuer != user.id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        for field, value in invoice.dict(exclude_unset=True).items():
-            setattr(invoice_db, field, value)
-        invoice_db = await invoice_db.save()
+        version = if_match_version(if_match, invoice_id)
+        previous, invoice_db = await update_document(
+            Invoice, invoice_id, user.id, invoice, version)
+        if invoice.__fields_set__ & {'emited', 'prestations'}:
+            await invoice_changed(previous, invoice_db)
+        return ORJSONResponse(invoice_db,
+                              headers={'ETag': document_etag(invoice_db)})
 
     @router.delete('/{invoice_id}', response_model=Invoice,
                    responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
@@ -77,38 +130,53 @@ def get_invoices_router(app):
         if invoice_db.issuer != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
         await invoice_db.delete()
+        await invoice_changed(invoice_db, None)
         return invoice_db
 
     @router.get('/{invoice_id}/generate',
                 status_code=202,
-                response_model=Message,
+                response_model=JobAccepted,
                 responses=dict([ACCEPTED, UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
     async def generate_pdf(invoice_id: PydanticObjectId,
-                           backgroud_tasks: BackgroundTasks,
                            user: UserDB = Depends(app.current_active_user)):
         invoice_db = await Invoice.get(invoice_id)
-        customer = await Customer.get(invoice_db.customer)
         if not invoice_db:
             raise HTTPException(status_code=404, detail="Not found")
         if invoice_db.issuer != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        backgroud_tasks.add_task(generate_pdf_invoice,
-                                 invoice_db, user, customer,
-                                 invoice_name=invoice_db.filename)
-        return JSONResponse(status_code=202,
-                            content=Message(message="Accepted").dict())
+        job = await enqueue_pdf_job(invoice_db, user.id)
+        content = JobAccepted(message="Accepted", job=job.id)
+        return ORJSONResponse(status_code=202, content=content,
+                              headers={'Location': f'/v1/jobs/{job.id}'})
+
+    @router.post('/{invoice_id}/send',
+                 status_code=202,
+                 response_model=Message,
+                 summary="Email the invoice to the customer",
+                 description="The PDF is attached, or linked with "
+                             "`attach` set to false. The email goes to the "
+                             "customer unless `to` is given.",
+                 responses=dict([ACCEPTED, UNAUTHORIZED, FORBIDDEN,
+                                 NOT_FOUND]))
+    async def send_invoice_to_customer(
+        invoice_id: PydanticObjectId,
+        payload: DocumentMailSchema,
+        user: UserDB = Depends(app.current_active_user)
+            ):
+        invoice_db = await Invoice.get(invoice_id)
+        if not invoice_db:
+            raise HTTPException(status_code=404, detail="Not found")
+        if invoice_db.issuer != user.id:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        await send_invoice(invoice_db, user, payload)
+        return ORJSONResponse(status_code=202,
+                              content=Message(message="Accepted"))
 
-    @router.get('/{invoice_id}/public', response_model=S3Link)
-    async def get_public_link(invoice_id: PydanticObjectId):
-        s3_link = await S3Link.find_one({"document": invoice_id})
-        invoice_filename = await Invoice.find({"_id": invoice_id})\
-            .project(InvoiceFilenameProjection).to_list()
-        invoice_filename = invoice_filename[0].filename + '.pdf'
-        print(invoice_filename)
-        if not s3_link:
-            public_url = create_presigned_url(invoice_filename)
-            s3_link = await S3Link(document=invoice_id,
-                                   url=public_url).create()
-        return s3_link
+    @router.get('/{invoice_id}/public', response_model=S3Link,
+                responses=dict([NOT_MODIFIED, NOT_FOUND]))
+    async def get_public_link(invoice_id: PydanticObjectId,
+                              if_none_match: Optional[str] = Header(None)):
+        link, etag = await get_document_link(Invoice, invoice_id)
+        return conditional_response(link, etag, if_none_match)
 
     return router
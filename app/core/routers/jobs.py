@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from beanie import PydanticObjectId
+
+from app.responses import UNAUTHORIZED, FORBIDDEN, NOT_FOUND
+from app.users.models import UserDB
+from app.core.documents import PdfJob
+
+
+def get_jobs_router(app):
+
+    router = APIRouter(tags=['jobs'], prefix='/jobs')
+
+    @router.get('/{job_id}', response_model=PdfJob,
+                summary="Return the status of a PDF job",
+                responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
+    async def get_job(job_id: PydanticObjectId,
+                      user: UserDB = Depends(app.current_active_user)):
+        job = await PdfJob.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Not found")
+        if job.user != user.id:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return job
+
+    return router
@@ -1,9 +1,11 @@
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from fastapi import APIRouter, Depends
 
 from app.users.models import UserDB
-from app.core.documents import Invoice
+from app.core.documents import PrestationStat
 from app.core.models import PrestationsAggregation
+from app.core.stats import month_of, next_month
 
 
 def get_prestations_router(app):
@@ -12,21 +14,38 @@ def get_prestations_router(app):
 
     @router.get('/prestations',
                 responses={401: {"description": "Unauthorized"}},
-                response_model=List[PrestationsAggregation])
+                response_model=List[PrestationsAggregation],
+                description="Aggregate the invoiced prestations by title. "
+                            "`start` and `end` select whole months.")
     async def get_user_prestations(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
         user: UserDB = Depends(app.current_active_user)
             ):
-        prestations = await Invoice.find(Invoice.issuer == user.id).aggregate(
+        query = {'issuer': user.id}
+        if start or end:
+            query['month'] = {}
+        if start:
+            query['month']['$gte'] = month_of(start)
+        if end:
+            query['month']['$lt'] = next_month(month_of(end))
+        prestations = await PrestationStat.find(query).aggregate(
             [
-                {"$unwind": "$prestations"},
-                {"$group": {"_id": "$prestations.title",
-                            "total_unit": {"$sum": "$prestations.quantity"},
-                            "total_without_charge": {
-                                "$sum": "$prestations.total"
+                {"$group": {"_id": "$title",
+                            "total_unit": {"$sum": "$total_unit"},
+                            "total_without_charge_cents": {
+                                "$sum": "$total_without_charge_cents"
                                 },
-                            "min_price": {"$min": "$prestations.unit_price"},
-                            "max_price": {"$max": "$prestations.unit_price"}
+                            "min_price_cents": {"$min": "$min_price_cents"},
+                            "max_price_cents": {"$max": "$max_price_cents"}
                             }
+                 },
+                {"$addFields": {
+                    "total_without_charge": {
+                        "$divide": ["$total_without_charge_cents", 100]},
+                    "min_price": {"$divide": ["$min_price_cents", 100]},
+                    "max_price": {"$divide": ["$max_price_cents", 100]}
+                    }
                  }
             ],
             projection_model=PrestationsAggregation
@@ -1,16 +1,28 @@
-from typing import List
-from datetime import datetime
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
 
-from app.responses import ACCEPTED, UNAUTHORIZED, FORBIDDEN, NOT_FOUND
+from app.responses import (ACCEPTED, NOT_MODIFIED, UNAUTHORIZED, FORBIDDEN,
+                           NOT_FOUND, CONFLICT, PRECONDITION_FAILED,
+                           MULTI_STATUS, NOTHING_CREATED,
+                           ORJSONResponse)
 from app.users.models import UserDB
-from app.core.documents import Customer, Quotation, S3Link
-from app.core.models import (InvoiceCreateSchema, InvoiceUpdateSchema,
-                             Message, InvoiceFilenameProjection)
-from app.core.utils import increment_reference, create_presigned_url
-from app.core.background_tasks import generate_pdf_invoice
+from app.core.documents import Quotation, S3Link
+from app.core.models import (BulkCreateResult, BulkCreateSchema,
+                             InvoiceCreateSchema, InvoiceUpdateSchema,
+                             JobAccepted)
+from app.core.bulk import bulk_create, bulk_status
+from app.core.jobs import enqueue_pdf_job, enqueue_pdf_jobs
+from app.core import trusted
+from app.core.etags import (conditional_response, document_etag,
+                            if_match_version)
+from app.core.fields import FieldSelection, find_one_projected
+from app.core.links import get_document_link
+from app.core.pagination import (NEXT_CURSOR_HEADER, PaginationParams,
+                                 paginate, stream_ndjson)
+from app.core.sequences import next_reference, record_references
+from app.core.updates import update_document
 
 
 def get_quotations_router(app):
@@ -19,56 +31,91 @@ def get_quotations_router(app):
 
     @router.get('', response_model=List[Quotation],
                 summary="Return user's quotations",
-                description="List all quotations for a specific user",
-                responses=dict([UNAUTHORIZED]))
+                description="List the quotations of a specific user, most "
+                            "recent first, one page at a time",
+                responses=dict([NOT_MODIFIED, UNAUTHORIZED]))
     async def list_user_quotations(
+        pagination: PaginationParams = Depends(),
+        selection: FieldSelection = Depends(),
+        if_none_match: Optional[str] = Header(None),
         user: UserDB = Depends(app.current_active_user)
             ):
-        quotations = await Quotation.find({"issuer": user.id}).to_list()
-        return quotations
+        query = {"issuer": user.id}
+        projection = selection.projection(Quotation)
+        if pagination.stream:
+            return stream_ndjson(Quotation, query, pagination, 'emited',
+                                 projection)
+        quotations, next_cursor, etag = await paginate(
+            Quotation, query, pagination, 'emited', projection)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return conditional_response(quotations, etag, if_none_match, headers)
 
     @router.get('/{quotation_id}', response_model=Quotation,
-                responses=dict([FORBIDDEN, NOT_FOUND]))
+                responses=dict([NOT_MODIFIED, FORBIDDEN, NOT_FOUND]))
     async def get_quotation(quotation_id: PydanticObjectId,
+                            selection: FieldSelection = Depends(),
+                            if_none_match: Optional[str] = Header(None),
                             user: UserDB = Depends(app.current_active_user)):
-        quotation = await Quotation.get(quotation_id)
+        projection = selection.projection(Quotation)
+        if projection:
+            content, etag = await find_one_projected(
+                Quotation, quotation_id, projection, 'issuer', user.id)
+            return conditional_response(content, etag, if_none_match)
+        quotation = await trusted.get(Quotation, quotation_id)
         if not quotation:
             raise HTTPException(status_code=404, detail="Not found")
         if quotation.issuer != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        return quotation
+        return conditional_response(quotation, document_etag(quotation),
+                                    if_none_match)
 
     @router.post('', response_model=Quotation, status_code=201,
-                 responses=dict([(201, {"model": Quotation}), UNAUTHORIZED]))
+                 responses=dict([(201, {"model": Quotation}), UNAUTHORIZED,
+                                 CONFLICT]))
     async def create_quotation(quotation: InvoiceCreateSchema,
                                user: UserDB = Depends(app.current_active_user)
                                ):
-        if not quotation.reference:
-            last_quotation = await Quotation.find(Quotation.issuer == user.id)\
-                .sort('-emited').limit(1).to_list()
-            if last_quotation:
-                current_ref = last_quotation[0].reference
-                quotation.reference = increment_reference(current_ref)
-            else:
-                quotation.reference = f"{datetime.now().year}-001"
-        quotation_db = await Quotation(**quotation.dict(), issuer=user.id)\
-            .create()
+        if quotation.reference:
+            await record_references(
+                Quotation, user.id,
+                [(quotation.reference, quotation.emited.year)])
+        else:
+            quotation.reference = await next_reference(Quotation, user.id,
+                                                       quotation.emited.year)
+        try:
+            quotation_db = await Quotation(**quotation.dict(),
+                                           issuer=user.id).create()
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Already exists")
         return quotation_db
 
+    @router.post('/bulk', response_model=BulkCreateResult, status_code=201,
+                 summary="Create several quotations",
+                 responses=dict([UNAUTHORIZED, MULTI_STATUS,
+                                 NOTHING_CREATED]))
+    async def bulk_create_quotations(
+        payload: BulkCreateSchema, response: Response,
+        user: UserDB = Depends(app.current_active_user)
+            ):
+        result, created = await bulk_create(Quotation, payload, user.id)
+        if payload.generate_pdf:
+            await enqueue_pdf_jobs(created, user.id)
+        response.status_code = bulk_status(result)
+        return result
+
     @router.patch('', response_model=Quotation,
-                  responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
+                  responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND,
+                                  CONFLICT, PRECONDITION_FAILED]))
     async def update_quotation(quotation_id: PydanticObjectId,
                                quotation: InvoiceUpdateSchema,
+                               if_match: Optional[str] = Header(None),
                                user: UserDB = Depends(app.current_active_user)
                                ):
-        quotation_db = await Quotation.get(quotation_id)
-        if not quotation_db:
-            raise HTTPException(status_code=404, detail="Not found")
-        if quotation_db.issuer != user.id:
-            raise HTTPException(status_code=403, detail="Forbidden")
-        for field, value in quotation.dict(exclude_unset=True).items():
-            setattr(quotation_db, field, value)
-        quotation_db = await quotation_db.save()
+        version = if_match_version(if_match, quotation_id)
+        _, quotation_db = await update_document(
+            Quotation, quotation_id, user.id, quotation, version)
+        return ORJSONResponse(quotation_db,
+                              headers={'ETag': document_etag(quotation_db)})
 
     @router.delete('/{quotation_id}', response_model=Quotation,
                    responses=dict([UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
@@ -85,34 +132,25 @@ def get_quotations_router(app):
 
     @router.get('/{quotation_id}/generate',
                 status_code=202,
-                response_model=Message,
+                response_model=JobAccepted,
                 responses=dict([ACCEPTED, UNAUTHORIZED, FORBIDDEN, NOT_FOUND]))
     async def generate_pdf(quotation_id: PydanticObjectId,
-                           backgroud_tasks: BackgroundTasks,
                            user: UserDB = Depends(app.current_active_user)):
         quotation_db = await Quotation.get(quotation_id)
-        customer = await Customer.get(quotation_db.customer)
         if not quotation_db:
             raise HTTPException(status_code=404, detail="Not found")
         if quotation_db.issuer != user.id:
             raise HTTPException(status_code=403, detail="Forbidden")
-        user.RIB = None
-        backgroud_tasks.add_task(generate_pdf_invoice,
-                                 quotation_db, user, customer,
-                                 invoice_name=quotation_db.filename)
-        return JSONResponse(status_code=202,
-                            content=Message(message="Accepted").dict())
+        job = await enqueue_pdf_job(quotation_db, user.id)
+        content = JobAccepted(message="Accepted", job=job.id)
+        return ORJSONResponse(status_code=202, content=content,
+                              headers={'Location': f'/v1/jobs/{job.id}'})
 
-    @router.get('/{quotation_id}/public', response_model=S3Link)
-    async def get_public_link(quotation_id: PydanticObjectId):
-        s3_link = await S3Link.find_one({"document": quotation_id})
-        quotation_filename = await Quotation.find({"_id": quotation_id})\
-            .project(InvoiceFilenameProjection).to_list()
-        quotation_filename = quotation_filename[0].filename + '.pdf'
-        if not s3_link:
-            public_url = create_presigned_url(quotation_filename)
-            s3_link = await S3Link(document=quotation_id,
-                                   url=public_url).create()
-        return s3_link
+    @router.get('/{quotation_id}/public', response_model=S3Link,
+                responses=dict([NOT_MODIFIED, NOT_FOUND]))
+    async def get_public_link(quotation_id: PydanticObjectId,
+                              if_none_match: Optional[str] = Header(None)):
+        link, etag = await get_document_link(Quotation, quotation_id)
+        return conditional_response(link, etag, if_none_match)
 
     return router
@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+
+from app import settings
+from app.responses import UNAUTHORIZED
+from app.users.models import UserDB
+from app.core.documents import RevenueMonth
+from app.core.models import RevenuePeriod, RevenueReport
+from app.core.money import to_euros
+
+
+def revenue_period(period: str, months) -> RevenuePeriod:
+    """Sum of the months, in cents, converted to euros once."""
+    months = [month for month in months if month]
+    return RevenuePeriod(
+        period=period,
+        invoices=sum(month.invoices for month in months),
+        total_without_charge=to_euros(sum(
+            month.total_without_charge_cents for month in months)),
+        total_vat=to_euros(sum(month.total_vat_cents for month in months)),
+        total=to_euros(sum(month.total_cents for month in months)))
+
+
+def revenue_report(year: int, months, today: datetime) -> RevenueReport:
+    by_month = {month.month.month: month for month in months}
+    months = [by_month.get(number) for number in range(1, 13)]
+    monthly = [revenue_period(f'{year}-{number:02d}', [month])
+               for number, month in enumerate(months, 1)]
+    quarters = [revenue_period(f'{year}-Q{quarter + 1}',
+                               months[quarter * 3:quarter * 3 + 3])
+                for quarter in range(4)]
+    total = revenue_period(str(year), months)
+    if year < today.year:
+        elapsed = 12
+    elif year == today.year:
+        elapsed = today.month
+    else:
+        elapsed = 0
+    year_to_date = revenue_period('', months[:elapsed]).total_without_charge
+    return RevenueReport(
+        year=year, months=monthly, quarters=quarters, total=total,
+        year_to_date=year_to_date, ceiling=settings.REVENUE_CEILING,
+        ceiling_share=year_to_date / settings.REVENUE_CEILING)
+
+
+def get_revenue_router(app):
+
+    router = APIRouter(tags=['revenue'])
+
+    @router.get('/revenue', response_model=RevenueReport,
+                summary="Revenue of a year",
+                description="Revenue per month, quarter and year, and the "
+                            "share of the turnover ceiling reached so far. "
+                            "Defaults to the current year.",
+                responses=dict([UNAUTHORIZED]))
+    async def get_user_revenue(
+        year: Optional[int] = Query(None, ge=1900, le=9998),
+        user: UserDB = Depends(app.current_active_user)
+            ):
+        today = datetime.now()
+        if year is None:
+            year = today.year
+        months = await RevenueMonth.find(
+            {'issuer': user.id,
+             'month': {'$gte': datetime(year, 1, 1),
+                       '$lt': datetime(year + 1, 1, 1)}}).to_list()
+        return revenue_report(year, months, today)
+
+    return router
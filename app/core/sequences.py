@@ -0,0 +1,144 @@
+"""Per-user, per-year reference numbering backed by atomic counters.
+
+Each counter also keeps the numbering scheme of the user: the prefix put
+before the number, where ``{year}`` stands for the year when it holds one,
+and the width of the number. The scheme is taken from the references the
+user chooses, so ``FA-2021-0042`` is followed by ``FA-2021-0043`` and
+``FA-2022-0001`` the next year. Without a year in the prefix, the numbers
+go on from one year to the next. New users get ``{year}-001``.
+"""
+import re
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.documents import ReferenceCounter
+
+
+DEFAULT_PREFIX = '{year}-'
+DEFAULT_WIDTH = 3
+YEAR_PLACEHOLDER = '{year}'
+
+reference_pattern = re.compile(r'^(.*?)(\d+)$')
+year_pattern = re.compile(r'(?<!\d)((?:19|20)\d\d)(?!\d)')
+
+
+class ParsedReference(NamedTuple):
+    year: int
+    prefix: str
+    width: int
+    number: int
+
+
+def format_reference(year: int, number: int, prefix: str = DEFAULT_PREFIX,
+                     width: int = DEFAULT_WIDTH) -> str:
+    return f"{prefix.replace(YEAR_PLACEHOLDER, str(year))}{number:0{width}d}"
+
+
+def parse_reference(reference: Optional[str],
+                    year: int) -> Optional[ParsedReference]:
+    """Scheme and number of a reference ending with a number, or None.
+
+    The year of the counter is the one written in the prefix, if any, or
+    ``year``, the year the document was emitted.
+    """
+    match = reference_pattern.match(reference or '')
+    if not match:
+        return None
+    prefix, digits = match[1], match[2]
+    found = year_pattern.search(prefix)
+    if found:
+        year = int(found[1])
+        prefix = prefix[:found.start()] + YEAR_PLACEHOLDER \
+            + prefix[found.end():]
+    return ParsedReference(year, prefix, len(digits), int(digits))
+
+
+def counter_kind(document_cls) -> str:
+    """Counters are kept apart per collection (invoices, quotations...)."""
+    return document_cls.Collection.name
+
+
+def _query(document_cls, user_id: UUID, year: int):
+    return {'user': user_id, 'kind': counter_kind(document_cls),
+            'year': year}
+
+
+async def _start_counter(document_cls, user_id: UUID, year: int):
+    """Create the counter of a year with the scheme of the latest counter
+    of the user. Numbers go on when the prefix has no year."""
+    collection = ReferenceCounter.get_motor_collection()
+    previous = await collection.find_one(
+        {'user': user_id, 'kind': counter_kind(document_cls),
+         'year': {'$lt': year}}, sort=[('year', DESCENDING)])
+    previous = previous or {}
+    prefix = previous.get('prefix') or DEFAULT_PREFIX
+    start = 0 if YEAR_PLACEHOLDER in prefix else previous.get('value', 0)
+    try:
+        await collection.update_one(
+            _query(document_cls, user_id, year),
+            {'$setOnInsert': {
+                'value': start, 'prefix': prefix,
+                'width': previous.get('width') or DEFAULT_WIDTH}},
+            upsert=True)
+    except DuplicateKeyError:
+        # Created meanwhile by a concurrent request.
+        pass
+
+
+async def reserve_references(document_cls, user_id: UUID, year: int,
+                             count: int = 1) -> List[str]:
+    """Reserve ``count`` consecutive references with a single update.
+
+    The counter is incremented with ``$inc`` so concurrent creations never
+    receive the same number, whatever the order they are written in.
+    """
+    collection = ReferenceCounter.get_motor_collection()
+    query = _query(document_cls, user_id, year)
+    update = {'$inc': {'value': count}}
+    counter = await collection.find_one_and_update(
+        query, update, return_document=ReturnDocument.AFTER)
+    if counter is None:
+        await _start_counter(document_cls, user_id, year)
+        counter = await collection.find_one_and_update(
+            query, update, return_document=ReturnDocument.AFTER)
+    prefix = counter.get('prefix') or DEFAULT_PREFIX
+    width = counter.get('width') or DEFAULT_WIDTH
+    last = counter['value']
+    return [format_reference(year, number, prefix, width)
+            for number in range(last - count + 1, last + 1)]
+
+
+async def next_reference(document_cls, user_id: UUID, year: int) -> str:
+    references = await reserve_references(document_cls, user_id, year)
+    return references[0]
+
+
+async def record_references(document_cls, user_id: UUID,
+                            references: Iterable[Tuple[str, int]]):
+    """Follow the references chosen by the client, given with the year
+    of their document.
+
+    The counters move past their numbers, with ``$max`` so they never go
+    back, otherwise the numbering would hand them out again and the
+    creation would fail with a conflict. Their scheme becomes the one the
+    next references are formatted with.
+    """
+    highest = {}
+    for reference, year in references:
+        parsed = parse_reference(reference, year)
+        if parsed and (parsed.year not in highest
+                       or parsed.number > highest[parsed.year].number):
+            highest[parsed.year] = parsed
+    collection = ReferenceCounter.get_motor_collection()
+    for year, parsed in highest.items():
+        query = _query(document_cls, user_id, year)
+        update = {'$max': {'value': parsed.number},
+                  '$set': {'prefix': parsed.prefix, 'width': parsed.width}}
+        try:
+            await collection.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # Two first updates raced on the upsert, the counter exists now.
+            await collection.update_one(query, update)
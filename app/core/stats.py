@@ -0,0 +1,240 @@
+"""Prestation statistics and revenue maintained alongside the invoices.
+
+``prestation_stats`` holds, per issuer, prestation title and month, the
+quantities, amounts and price range of the invoiced lines, and
+``revenue_months`` the number of invoices and the revenue of each issuer
+per month. Amounts are summed in cents from the totals stored with the
+invoices. Creations add to them with ``$inc``/``$min``/``$max``. Updates
+and deletions take their counts and amounts back with ``$inc`` too, and
+recompute the price range of the prestations they touch, since a minimum
+or a maximum cannot be taken back. A creation racing with that recompute
+may leave a price range off until the next rebuild:
+``rebuild_prestation_stats`` and ``rebuild_revenue`` (the
+``rebuild-prestation-stats`` and ``rebuild-revenue`` commands of
+``manage.py``) recompute everything and repair any drift.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.core.documents import Invoice, PrestationStat, RevenueMonth
+
+
+def month_of(date: datetime) -> datetime:
+    return datetime(date.year, date.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    if month.month == 12:
+        return datetime(month.year + 1, 1, 1)
+    return datetime(month.year, month.month + 1, 1)
+
+
+def _month_expression(field):
+    return {'$dateFromParts': {'year': {'$year': field},
+                               'month': {'$month': field}}}
+
+
+def stats_pipeline(match):
+    return [
+        {'$match': match},
+        {'$unwind': '$prestations'},
+        {'$group': {
+            '_id': {
+                'issuer': '$issuer',
+                'title': '$prestations.title',
+                'month': _month_expression('$emited'),
+            },
+            'lines': {'$sum': 1},
+            'total_unit': {'$sum': '$prestations.quantity'},
+            'total_without_charge_cents': {
+                '$sum': '$prestations.total_cents'},
+            'min_price_cents': {'$min': '$prestations.unit_price_cents'},
+            'max_price_cents': {'$max': '$prestations.unit_price_cents'},
+        }},
+        {'$project': {
+            '_id': False,
+            'issuer': '$_id.issuer',
+            'title': '$_id.title',
+            'month': '$_id.month',
+            'lines': True,
+            'total_unit': True,
+            'total_without_charge_cents': True,
+            'min_price_cents': True,
+            'max_price_cents': True,
+        }},
+    ]
+
+
+def revenue_pipeline(match):
+    return [
+        {'$match': match},
+        {'$group': {
+            '_id': {'issuer': '$issuer',
+                    'month': _month_expression('$emited')},
+            'invoices': {'$sum': 1},
+            'total_without_charge_cents': {
+                '$sum': '$total_without_charge_cents'},
+            'total_vat_cents': {'$sum': '$total_vat_cents'},
+            'total_cents': {'$sum': '$total_cents'},
+        }},
+        {'$project': {
+            '_id': False,
+            'issuer': '$_id.issuer',
+            'month': '$_id.month',
+            'invoices': True,
+            'total_without_charge_cents': True,
+            'total_vat_cents': True,
+            'total_cents': True,
+        }},
+    ]
+
+
+async def record_invoices(invoices: Iterable[Invoice]):
+    """Add newly created invoices to the statistics and the revenue."""
+    operations = []
+    revenue = []
+    for invoice in invoices:
+        month = month_of(invoice.emited)
+        revenue.append(UpdateOne(
+            {'issuer': invoice.issuer, 'month': month},
+            {'$inc': {'invoices': 1,
+                      'total_without_charge_cents':
+                          invoice.total_without_charge_cents,
+                      'total_vat_cents': invoice.total_vat_cents,
+                      'total_cents': invoice.total_cents}},
+            upsert=True))
+        for prestation in invoice.prestations:
+            operations.append(UpdateOne(
+                {'issuer': invoice.issuer, 'title': prestation.title,
+                 'month': month},
+                {'$inc': {'lines': 1,
+                          'total_unit': prestation.quantity,
+                          'total_without_charge_cents':
+                              prestation.total_cents},
+                 '$min': {'min_price_cents': prestation.unit_price_cents},
+                 '$max': {'max_price_cents': prestation.unit_price_cents}},
+                upsert=True))
+    if operations:
+        await PrestationStat.get_motor_collection().bulk_write(
+            operations, ordered=False)
+    if revenue:
+        await RevenueMonth.get_motor_collection().bulk_write(
+            revenue, ordered=False)
+
+
+REVENUE_FIELDS = ('total_without_charge_cents', 'total_vat_cents',
+                  'total_cents')
+
+
+def invoice_deltas(previous: Optional[Invoice], current: Optional[Invoice]
+                   ) -> Tuple[Dict[datetime, dict],
+                              Dict[Tuple[str, datetime], dict]]:
+    """What a change of an invoice adds to the revenue of each month and
+    to the statistics of each prestation title and month."""
+    revenue, stats = {}, {}
+    for sign, invoice in ((-1, previous), (1, current)):
+        if not invoice:
+            continue
+        month = month_of(invoice.emited)
+        totals = revenue.setdefault(
+            month, dict.fromkeys(('invoices',) + REVENUE_FIELDS, 0))
+        totals['invoices'] += sign
+        for field in REVENUE_FIELDS:
+            totals[field] += sign * getattr(invoice, field)
+        for prestation in invoice.prestations:
+            totals = stats.setdefault(
+                (prestation.title, month),
+                dict.fromkeys(('lines', 'total_unit',
+                               'total_without_charge_cents'), 0))
+            totals['lines'] += sign
+            totals['total_unit'] += sign * prestation.quantity
+            totals['total_without_charge_cents'] += \
+                sign * prestation.total_cents
+    return revenue, stats
+
+
+def _increments(query, deltas):
+    changed = {field: delta for field, delta in deltas.items() if delta}
+    if changed:
+        return UpdateOne(query, {'$inc': changed}, upsert=True)
+
+
+async def _price_ranges(issuer, month: datetime, titles):
+    """Price range of some prestation titles in the invoices of a month."""
+    pipeline = [
+        {'$match': {'issuer': issuer,
+                    'emited': {'$gte': month, '$lt': next_month(month)}}},
+        {'$unwind': '$prestations'},
+        {'$match': {'prestations.title': {'$in': list(titles)}}},
+        {'$group': {
+            '_id': '$prestations.title',
+            'min_price_cents': {'$min': '$prestations.unit_price_cents'},
+            'max_price_cents': {'$max': '$prestations.unit_price_cents'},
+        }},
+    ]
+    rows = await Invoice.get_motor_collection().aggregate(
+        pipeline).to_list(None)
+    return {row.pop('_id'): row for row in rows}
+
+
+async def invoice_changed(previous: Optional[Invoice],
+                          current: Optional[Invoice]):
+    """Apply an update or a deletion of an invoice, once written.
+
+    Rows left without invoices or lines are deleted, only if they still
+    are when deleting: a concurrent creation upserts them again.
+    """
+    issuer = (current or previous).issuer
+    revenue, stats = invoice_deltas(previous, current)
+    operations = [_increments({'issuer': issuer, 'month': month}, deltas)
+                  for month, deltas in revenue.items()]
+    operations = [operation for operation in operations if operation]
+    collection = RevenueMonth.get_motor_collection()
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+    await collection.delete_many({'issuer': issuer,
+                                  'month': {'$in': list(revenue)},
+                                  'invoices': {'$lte': 0}})
+
+    collection = PrestationStat.get_motor_collection()
+    operations = [_increments({'issuer': issuer, 'title': title,
+                               'month': month}, deltas)
+                  for (title, month), deltas in stats.items()]
+    operations = [operation for operation in operations if operation]
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+    for month in {month for _, month in stats}:
+        titles = {title for title, other in stats if other == month}
+        ranges = await _price_ranges(issuer, month, titles)
+        operations = [UpdateOne({'issuer': issuer, 'title': title,
+                                 'month': month}, {'$set': ranges[title]})
+                      for title in titles if title in ranges]
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+        await collection.delete_many({
+            'issuer': issuer, 'month': month,
+            'title': {'$in': list(titles - set(ranges))},
+            'lines': {'$lte': 0}})
+
+
+async def rebuild_prestation_stats():
+    """Recompute the whole collection from the invoices.
+
+    ``$out`` swaps the collection atomically and keeps its indexes.
+    """
+    pipeline = stats_pipeline({}) + [
+        {'$out': PrestationStat.Collection.name}]
+    await Invoice.get_motor_collection().aggregate(
+        pipeline, allowDiskUse=True).to_list(None)
+    return await PrestationStat.get_motor_collection().count_documents({})
+
+
+async def rebuild_revenue():
+    """Recompute the monthly revenue of every issuer from the invoices."""
+    pipeline = revenue_pipeline({}) + [
+        {'$out': RevenueMonth.Collection.name}]
+    await Invoice.get_motor_collection().aggregate(
+        pipeline, allowDiskUse=True).to_list(None)
+    return await RevenueMonth.get_motor_collection().count_documents({})
@@ -0,0 +1,33 @@
+"""Documents built from stored data without running the validators.
+
+Everything in the collections went through the models when it was
+written, computed fields such as the totals included. Reading it back
+through the validators repeats that work, once per document and once per
+prestation, which is most of the CPU time of a large listing. The read
+endpoints build their documents with ``construct`` instead. Nested models
+stay plain dicts, so these documents are meant to be serialized, not
+modified: writes still validate.
+"""
+from functools import lru_cache
+from typing import Dict, Tuple
+
+
+@lru_cache(maxsize=None)
+def _aliases(document_cls) -> Tuple[Tuple[str, str], ...]:
+    return tuple((name, field.alias)
+                 for name, field in document_cls.__fields__.items())
+
+
+def construct(document_cls, data: Dict):
+    """Document of the stored ``data``, fields missing from it set to
+    their default and unknown keys dropped."""
+    values = {name: data[alias] for name, alias in _aliases(document_cls)
+              if alias in data}
+    return document_cls.construct(**values)
+
+
+async def get(document_cls, document_id):
+    """Trusted counterpart of ``Document.get``."""
+    data = await document_cls.get_motor_collection().find_one(
+        {'_id': document_id})
+    return construct(document_cls, data) if data else None
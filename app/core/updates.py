@@ -0,0 +1,69 @@
+"""Partial updates of invoices and quotations."""
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core.models import InvoiceUpdateSchema
+from app.core.money import totals
+from app.core.sequences import record_references
+
+
+def changed_fields(changes: InvoiceUpdateSchema) -> dict:
+    """Fields sent by the client, with the totals when the prestations
+    change."""
+    # Not exclude_unset, which would also drop the computed prestation
+    # totals and default VAT rates.
+    fields = changes.dict(include=changes.__fields_set__, exclude_none=True)
+    if 'prestations' in fields:
+        fields.update(totals(fields['prestations']))
+    return fields
+
+
+async def _refuse(document_cls, document_id, owner):
+    """Tell why the update matched nothing."""
+    document = await document_cls.get_motor_collection().find_one(
+        {'_id': document_id}, {'issuer': True})
+    if not document:
+        raise HTTPException(status_code=404, detail="Not found")
+    if document['issuer'] != owner:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    raise HTTPException(status_code=412, detail="Precondition failed")
+
+
+async def update_document(document_cls, document_id, owner,
+                          changes: InvoiceUpdateSchema,
+                          version: Optional[int] = None) -> Tuple:
+    """Apply a PATCH with a single ``find_one_and_update``.
+
+    Only the changed fields are sent in ``$set`` and the version is
+    incremented. With ``version``, the document must not have changed
+    since the client read it. The document is returned as it was before
+    the update, the updated one is rebuilt from it, so callers get both
+    without another round trip.
+    """
+    fields = changed_fields(changes)
+    query = {'_id': document_id, 'issuer': owner}
+    if version is not None:
+        # Documents written before versions existed have no version field.
+        query['version'] = {'$in': [0, None]} if version == 0 else version
+    # An empty PATCH still checks the owner and the version.
+    update = {'$inc': {'version': 1 if fields else 0}}
+    if fields:
+        update['$set'] = fields
+    try:
+        previous = await document_cls.get_motor_collection()\
+            .find_one_and_update(query, update,
+                                 return_document=ReturnDocument.BEFORE)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Already exists")
+    if previous is None:
+        await _refuse(document_cls, document_id, owner)
+    current = {**previous, **fields}
+    current['version'] = previous.get('version', 0) + update['$inc']['version']
+    if 'reference' in fields:
+        await record_references(
+            document_cls, owner,
+            [(fields['reference'], current['emited'].year)])
+    return document_cls.parse_obj(previous), document_cls.parse_obj(current)
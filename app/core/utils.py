@@ -1,10 +1,13 @@
+import asyncio
+import functools
+import hashlib
 import os
 import re
-import boto3
-from botocore.config import Config
-from botocore.exceptions import ClientError
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from app import settings
+from app.metrics import histogram
 
 
 regex = re.compile(r'(\d+)$')
@@ -16,37 +19,112 @@ def increment_reference(reference: str):
     return re.sub(regex, next_count, reference)
 
 
+def _normalize(value):
+    return ' '.join(str(value).split()).casefold() if value else ''
+
+
+def customer_fingerprint(customer: dict) -> str:
+    """Identity of a customer, insensitive to case and spacing.
+
+    Built from the owner, the names, the email and the address, it is
+    backed by a unique index to refuse duplicates in a single insert.
+    """
+    address = customer.get('address') or {}
+    if not isinstance(address, dict):
+        address = address.dict()
+    parts = [str(customer['user'])]
+    parts += [_normalize(customer.get(field))
+              for field in ('name', 'first_name', 'last_name', 'email')]
+    parts += [_normalize(address.get(field))
+              for field in ('address', 'zip_code', 'city')]
+    return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+
+MB = 1024 ** 2
+
+# boto3 and botocore are imported on first use: they weigh a large part of
+# the start time of the application and most requests never reach S3.
+
+
+@functools.lru_cache(maxsize=None)
+def get_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=settings.AWS_MULTIPART_THRESHOLD * MB,
+        multipart_chunksize=settings.AWS_MULTIPART_CHUNKSIZE * MB,
+        max_concurrency=settings.AWS_TRANSFER_CONCURRENCY)
+
+
+s3_requests = histogram('s3_request_duration_seconds',
+                        "Duration of the S3 requests, by operation")
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_s3_executor = None
+
+
+def get_s3_client():
+    """Return the S3 client of the process, created on first use.
+
+    boto3 clients are thread-safe and keep a pool of connections, so one
+    client is shared by every call instead of paying for the construction
+    and a new TLS handshake each time.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+                config = Config(
+                    region_name=settings.AWS_REGION,
+                    signature_version='s3v4',
+                    retries={
+                        'max_attempts': 10,
+                        'mode': 'standard',
+                    },
+                    max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+                    s3={'addressing_style': 'path'})
+                session = boto3.session.Session(
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
+                _s3_client = session.client(
+                    's3', endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+                    config=config)
+    return _s3_client
+
+
+def reset_s3_client():
+    global _s3_client
+    with _s3_client_lock:
+        _s3_client = None
+
+
+def get_s3_executor():
+    global _s3_executor
+    if _s3_executor is None:
+        with _s3_client_lock:
+            if _s3_executor is None:
+                _s3_executor = ThreadPoolExecutor(
+                    max_workers=settings.AWS_MAX_POOL_CONNECTIONS,
+                    thread_name_prefix='s3')
+    return _s3_executor
+
+
 def create_presigned_url(object_name, expiration=3600):
     """Generate a presigned URL to share an S3 object
 
-    :param bucket_name: string
     :param object_name: string
     :param expiration: Time in seconds for the presigned URL to remain valid
     :return: Presigned URL as string. If error, returns None.
     """
-
-    # Generate a presigned URL for the S3 object
-    config = Config(
-        region_name='eu-west-3',
-        signature_version='s3v4',
-        retries={
-            'max_attempts': 10,
-        },
-        s3={'addressing_style': 'path'})
-    key_id = settings.AWS_ACCESS_KEY_ID
-    secret_key = settings.AWS_SECRET_ACCESS_KEY
-    s3_client = boto3.client('s3',
-                             aws_access_key_id=key_id,
-                             aws_secret_access_key=secret_key,
-                             config=config)
-
+    from botocore.exceptions import ClientError
     params = {'Bucket': settings.AWS_BUCKET_NAME,
               'Key': object_name}
-    print(params)
     try:
-        response = s3_client.generate_presigned_url('get_object',
-                                                    Params=params,
-                                                    ExpiresIn=expiration)
+        with s3_requests.time(operation='presign'):
+            response = get_s3_client().generate_presigned_url(
+                'get_object', Params=params, ExpiresIn=expiration)
     except ClientError:
         return None
 
@@ -54,11 +132,45 @@ def create_presigned_url(object_name, expiration=3600):
     return response
 
 
+def object_exists(object_name):
+    """Check whether an object is stored in the S3 bucket
+
+    :param object_name: string
+    :return: True if the object exists, else False
+    """
+    from botocore.exceptions import ClientError
+    try:
+        with s3_requests.time(operation='head'):
+            get_s3_client().head_object(Bucket=settings.AWS_BUCKET_NAME,
+                                        Key=object_name)
+    except ClientError:
+        return False
+    return True
+
+
+def get_object_body(object_name):
+    """Open an object of the S3 bucket for streaming
+
+    :param object_name: string
+    :return: The botocore StreamingBody, or None if the object is missing
+    """
+    from botocore.exceptions import ClientError
+    try:
+        with s3_requests.time(operation='get'):
+            response = get_s3_client().get_object(
+                Bucket=settings.AWS_BUCKET_NAME, Key=object_name)
+    except ClientError:
+        return None
+    return response['Body']
+
+
 def upload_file(file_name, object_name=None):
     """Upload a file to an S3 bucket
 
+    Files larger than AWS_MULTIPART_THRESHOLD are sent as a multipart
+    upload.
+
     :param file_name: File to upload
-    :param bucket: Bucket to upload to
     :param object_name: S3 object name. If not specified then file_name is used
     :return: True if file was uploaded, else False
     """
@@ -68,13 +180,36 @@ def upload_file(file_name, object_name=None):
         object_name = os.path.basename(file_name)
 
     # Upload the file
-    key_id = settings.AWS_ACCESS_KEY_ID
-    secret_key = settings.AWS_SECRET_ACCESS_KEY
-    s3_client = boto3.client('s3',
-                             aws_access_key_id=key_id,
-                             aws_secret_access_key=secret_key)
+    from botocore.exceptions import ClientError
     try:
-        s3_client.upload_file(file_name, settings.AWS_BUCKET_NAME, object_name)
+        with s3_requests.time(operation='upload'):
+            get_s3_client().upload_file(
+                file_name, settings.AWS_BUCKET_NAME, object_name,
+                Config=get_transfer_config())
     except ClientError:
         return False
     return True
+
+
+async def run_in_s3_executor(func, *args, **kwargs):
+    """Run a blocking S3 call in the bounded S3 thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_s3_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def create_presigned_url_async(object_name, expiration=3600):
+    return await run_in_s3_executor(create_presigned_url, object_name,
+                                    expiration)
+
+
+async def object_exists_async(object_name):
+    return await run_in_s3_executor(object_exists, object_name)
+
+
+async def get_object_body_async(object_name):
+    return await run_in_s3_executor(get_object_body, object_name)
+
+
+async def upload_file_async(file_name, object_name=None):
+    return await run_in_s3_executor(upload_file, file_name, object_name)
@@ -0,0 +1,45 @@
+"""MongoDB client creation and Beanie initialisation."""
+import time
+
+import motor.motor_asyncio
+from beanie import init_beanie
+
+from app import settings
+from app.core.indexes import reconcile_indexes
+from app.monitoring import MongoCommandListener
+
+
+def get_database_url():
+    mongo_settings = settings.DATABASES['mongodb']
+    return mongo_settings['url'].format(**mongo_settings)
+
+
+def get_mongodb_client(url=None):
+    mongo_settings = settings.DATABASES['mongodb']
+    return motor.motor_asyncio.AsyncIOMotorClient(
+        url or get_database_url(), uuidRepresentation="standard",
+        maxPoolSize=mongo_settings['max_pool_size'],
+        minPoolSize=mongo_settings['min_pool_size'],
+        event_listeners=[MongoCommandListener()]
+    )
+
+
+async def init_db(client, database_name=None, timings=None):
+    """Bind the documents to the database and reconcile their indexes.
+
+    Return the database and the index reports. The time spent in each step
+    is stored in ``timings`` when a dict is given.
+    """
+    timings = {} if timings is None else timings
+    database_name = database_name or \
+        settings.DATABASES['mongodb']['database_name']
+    database = client[database_name]
+    started = time.perf_counter()
+    await init_beanie(database=database,
+                      document_models=settings.BEANIE_DOCUMENTS,
+                      allow_index_dropping=False)
+    timings['init_beanie'] = time.perf_counter() - started
+    started = time.perf_counter()
+    index_reports = await reconcile_indexes(settings.BEANIE_DOCUMENTS)
+    timings['indexes'] = time.perf_counter() - started
+    return database, index_reports
@@ -0,0 +1,182 @@
+"""Outbound email through the SendGrid v3 API.
+
+Every request goes through one ``httpx.AsyncClient``, so connections are
+kept alive between emails. ``MailQueue`` sends in the background with a
+bounded number of concurrent requests and retries throttled or failed
+requests with an exponential backoff. Mass sends are batched: recipients
+sharing a message become personalizations of a single request.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from app import settings
+from app.metrics import counter, gauge
+
+
+logger = logging.getLogger(__name__)
+
+# SendGrid accepts at most 1000 personalizations per request.
+MAX_PERSONALIZATIONS = 1000
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_client = None
+
+mail_failures = counter('email_failures_total',
+                        "Email requests given up after their retries")
+
+
+def get_http_client(transport=None):
+    """Return the HTTP client shared by every email, created on first use.
+
+    ``transport`` replaces the network, e.g. with an ``httpx.MockTransport``
+    standing in for SendGrid. httpx is only imported once an email is sent.
+    """
+    global _client
+    if _client is None or transport is not None:
+        import httpx
+        _client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(settings.EMAIL_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.EMAIL_CONCURRENCY,
+                max_keepalive_connections=settings.EMAIL_CONCURRENCY))
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class MailError(Exception):
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def recipient(email: str, substitutions: Optional[Dict[str, str]] = None):
+    personalization = {'to': [{'email': email}]}
+    if substitutions:
+        personalization['substitutions'] = substitutions
+    return personalization
+
+
+def build_payloads(personalizations: List[dict], subject: str,
+                   content: str, content_type: str = 'text/plain',
+                   attachments: Optional[List[dict]] = None,
+                   reply_to: Optional[str] = None) -> List[dict]:
+    """Split a send into requests of at most MAX_PERSONALIZATIONS each."""
+    payloads = []
+    for start in range(0, len(personalizations), MAX_PERSONALIZATIONS):
+        payload = {
+            'personalizations':
+                personalizations[start:start + MAX_PERSONALIZATIONS],
+            'from': {'email': settings.SENDGRID_FROM_EMAIL},
+            'subject': subject,
+            'content': [{'type': content_type, 'value': content}],
+        }
+        if attachments:
+            payload['attachments'] = attachments
+        if reply_to:
+            payload['reply_to'] = {'email': reply_to}
+        payloads.append(payload)
+    return payloads
+
+
+async def post(payload: dict):
+    """Send one request to SendGrid, raising MailError if it is refused."""
+    import httpx
+    headers = {'authorization': f'Bearer {settings.SENDGRID_API_KEY}'}
+    try:
+        response = await get_http_client().post(
+            settings.SENDGRID_EMAIL_SEND_URL, json=payload, headers=headers)
+    except httpx.TransportError as e:
+        raise MailError(f"Email error, {type(e).__name__}: {e}",
+                        retryable=True)
+    if response.status_code != 202:
+        raise MailError(
+            f"Email error, sendgrid respond with HTTP_{response.status_code}",
+            retryable=response.status_code in RETRYABLE_STATUS)
+
+
+def retry_delay(attempts: int) -> float:
+    return settings.EMAIL_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+async def deliver(payload: dict):
+    """Send a request, retrying it while SendGrid is unavailable."""
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            return await post(payload)
+        except MailError as e:
+            if not e.retryable or attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                raise
+            logger.warning("%s, attempt %s", e, attempts)
+            await asyncio.sleep(retry_delay(attempts))
+
+
+def queue_depth():
+    queue = MailQueue.instance
+    return queue.queue.qsize() if queue else 0
+
+
+gauge('email_queue_depth', "Email requests waiting to be sent", queue_depth)
+
+
+class MailQueue:
+    """Send emails in the background with bounded concurrency."""
+
+    instance = None
+
+    def __init__(self, concurrency=None, maxsize=None):
+        self.concurrency = concurrency or settings.EMAIL_CONCURRENCY
+        self.queue = asyncio.Queue(maxsize or settings.EMAIL_QUEUE_SIZE)
+        self.tasks = []
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self.run())
+                      for _ in range(self.concurrency)]
+        MailQueue.instance = self
+
+    async def stop(self):
+        """Send the queued emails, then stop the senders."""
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        MailQueue.instance = None
+
+    async def put(self, payload: dict):
+        await self.queue.put(payload)
+
+    async def run(self):
+        while True:
+            payload = await self.queue.get()
+            try:
+                await deliver(payload)
+            except Exception:
+                mail_failures.inc()
+                logger.exception("Unable to send an email to %s recipients",
+                                 len(payload['personalizations']))
+            finally:
+                self.queue.task_done()
+
+
+async def send(personalizations: List[dict], subject: str, content: str,
+               content_type: str = 'text/plain',
+               attachments: Optional[List[dict]] = None,
+               reply_to: Optional[str] = None):
+    """Queue an email, or send it right away when no queue is running."""
+    for payload in build_payloads(personalizations, subject, content,
+                                  content_type, attachments, reply_to):
+        if MailQueue.instance:
+            await MailQueue.instance.put(payload)
+        else:
+            await deliver(payload)
@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Depends
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI, Depends, Response
 from fastapi_users import FastAPIUsers
 from fastapi_users.db import MongoDBUserDatabase
-from beanie import init_beanie
-import motor.motor_asyncio
 
-from app import settings
-from app.settings import DATABASES
+from app import IMPORT_STARTED, settings
+from app.db import get_mongodb_client, init_db
+from app.mail import MailQueue, close_http_client
+from app.responses import ORJSONResponse
+from app.metrics import PROMETHEUS_MEDIA_TYPE, publish, render
+from app.monitoring import MetricsMiddleware, startup_seconds
+from app.core.jobs import PdfWorker
 from app.users.models import User, UserCreate, UserUpdate, UserDB
 from app.users.auth import jwt_authentication
 from app.users.routers import get_users_router
@@ -13,48 +20,86 @@ from app.users.managers import UserManager
 
 from app.core.routers import get_core_router
 
-app = FastAPI()
 
+logger = logging.getLogger(__name__)
 
-@app.on_event("startup")
-async def app_init():
-    MONGO_SETTINGS = DATABASES['mongodb']
-    DB_NAME = MONGO_SETTINGS['database_name']
-    DATABASE_URL = MONGO_SETTINGS['url'].format(**MONGO_SETTINGS)
-    app.mongodb_client = motor.motor_asyncio.AsyncIOMotorClient(
-        DATABASE_URL, uuidRepresentation="standard"
-    )
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(MetricsMiddleware)
+
+
+# The routes are built at import time. Only the user database needs the
+# Mongo client, and it is looked up on the application when a request
+# comes in, once the startup is done.
+def get_user_db():
+    yield app.user_db
 
-    app.db = app.mongodb_client[DB_NAME]
 
-    await init_beanie(database=app.mongodb_client[DB_NAME],
-                      document_models=settings.BEANIE_DOCUMENTS)
+app.get_user_db = get_user_db
 
-    def get_user_db():
-        yield MongoDBUserDatabase(UserDB, app.db['users'])
 
-    app.get_user_db = get_user_db
+def get_user_manager(user_db=Depends(app.get_user_db)):
+    yield UserManager(user_db)
 
-    def get_user_manager(user_db=Depends(app.get_user_db)):
-        yield UserManager(user_db)
 
-    app.get_user_manager = get_user_manager
+app.get_user_manager = get_user_manager
 
-    app.fastapi_users = FastAPIUsers(
-        get_user_manager,
-        [jwt_authentication],
-        User,
-        UserCreate,
-        UserUpdate,
-        UserDB,
-    )
+app.fastapi_users = FastAPIUsers(
+    get_user_manager,
+    [jwt_authentication],
+    User,
+    UserCreate,
+    UserUpdate,
+    UserDB,
+)
 
-    app.current_active_user = app.fastapi_users.current_user(active=True)
+app.current_active_user = app.fastapi_users.current_user(active=True)
 
-    app.include_router(get_users_router(app))
-    app.include_router(get_core_router(app), prefix='/v1')
+app.include_router(get_users_router(app))
+app.include_router(get_core_router(app), prefix='/v1')
+
+app.startup_timings = {'import': time.perf_counter() - IMPORT_STARTED}
+
+
+@app.on_event("startup")
+async def app_init():
+    started = time.perf_counter()
+    app.mongodb_client = get_mongodb_client()
+    app.db, app.index_reports = await init_db(app.mongodb_client,
+                                              timings=app.startup_timings)
+    # Built once: the constructor sends createIndex commands to Mongo.
+    app.user_db = MongoDBUserDatabase(UserDB, app.db['users'])
+    app.pdf_worker = PdfWorker(app.db)
+    await app.pdf_worker.start()
+    app.mail_queue = MailQueue()
+    await app.mail_queue.start()
+    app.metrics_publisher = asyncio.create_task(publish(
+        settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)) \
+        if settings.METRICS_DIR else None
+    app.startup_timings['startup'] = time.perf_counter() - started
+    for phase, seconds in app.startup_timings.items():
+        startup_seconds.set(seconds, phase=phase)
+    logger.info("Started: %s", ', '.join(
+        f'{phase} {seconds:.3f}s'
+        for phase, seconds in app.startup_timings.items()))
+    if settings.SERVER_PROCESSES > 1:
+        logger.info("The user and link caches are local to each of the %s "
+                    "processes: changes reach the other processes within "
+                    "%gs and %gs", settings.SERVER_PROCESSES,
+                    settings.USER_CACHE_TTL, settings.PUBLIC_LINK_CACHE_TTL)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    content = await render(settings.METRICS_DIR,
+                           max_age=3 * settings.METRICS_FLUSH_INTERVAL)
+    return Response(content, media_type=PROMETHEUS_MEDIA_TYPE)
 
 
 @app.on_event("shutdown")
 async def shutdown_app():
+    if app.metrics_publisher:
+        app.metrics_publisher.cancel()
+    await app.pdf_worker.stop()
+    await app.mail_queue.stop()
+    await close_http_client()
     app.mongodb_client.close()
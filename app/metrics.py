@@ -0,0 +1,250 @@
+"""In-process metrics exposed on ``/metrics`` in the Prometheus format.
+
+Metrics are registered once at import time with ``counter``, ``histogram``
+or ``gauge`` and updated from any thread. Gauges may be given a function,
+called at scrape time, returning the value or a dict of values keyed by
+tuples of ``(label, value)`` pairs.
+
+When several processes serve the application, each one writes its
+metrics to a shared directory with ``publish`` and ``render`` merges
+them: counters and histograms are summed, gauges are labelled with the
+``pid`` of their process and dropped once it stops publishing.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MEDIA_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"')
+               .replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value
+                          in zip(labels, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self._lock = Lock()
+
+    @property
+    def value(self):
+        return self.values.get((), 0)
+
+    def inc(self, amount=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    async def samples(self):
+        with self._lock:
+            values = sorted(self.values.items())
+        return [(self.name, key, value) for key, value in values]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def __init__(self, name, description, function: Optional[Callable] = None):
+        super().__init__(name, description)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[_labels(labels)] = value
+
+    async def samples(self):
+        if self.function is not None:
+            try:
+                value = self.function()
+                if asyncio.iscoroutine(value):
+                    value = await value
+            except Exception:
+                logger.exception("Unable to collect %s", self.name)
+            else:
+                if isinstance(value, dict):
+                    value = {tuple(sorted(labels)): v
+                             for labels, v in value.items()}
+                elif value is not None:
+                    value = {(): value}
+                if value is not None:
+                    with self._lock:
+                        self.values = value
+        return await super().samples()
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, description,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self.values.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    async def samples(self):
+        samples = []
+        with self._lock:
+            values = sorted((key, (list(counts), total))
+                            for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            cumulated = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulated += count
+                samples.append((f'{self.name}_bucket',
+                                key + (('le', _format_value(bound)),),
+                                cumulated))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, cumulated))
+        return samples
+
+
+REGISTRY = {}
+
+
+def _register(cls, name, description, **kwargs):
+    if name not in REGISTRY:
+        REGISTRY[name] = cls(name, description, **kwargs)
+    return REGISTRY[name]
+
+
+def counter(name, description) -> Counter:
+    return _register(Counter, name, description)
+
+
+def gauge(name, description, function=None) -> Gauge:
+    return _register(Gauge, name, description, function=function)
+
+
+def histogram(name, description, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, description, buckets=buckets)
+
+
+async def snapshot() -> Dict[str, dict]:
+    """Type, description and samples of every registered metric."""
+    return {name: {'type': metric.type, 'description': metric.description,
+                   'samples': await metric.samples()}
+            for name, metric in REGISTRY.items()}
+
+
+async def write_snapshot(directory):
+    """Write the metrics of this process where the others read them."""
+    path = Path(directory) / f'{os.getpid()}.json'
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(await snapshot()))
+    os.replace(temporary, path)
+
+
+async def publish(directory, interval: float):
+    """Write the metrics of this process every ``interval`` seconds."""
+    while True:
+        try:
+            await write_snapshot(directory)
+        except Exception:
+            logger.exception("Unable to write the metrics to %s", directory)
+        await asyncio.sleep(interval)
+
+
+def read_snapshots(directory, max_age: float) -> Dict[str, tuple]:
+    """Snapshots of the processes keyed by pid, with whether they were
+    written in the last ``max_age`` seconds."""
+    snapshots = {}
+    limit = time.time() - max_age
+    for path in Path(directory).glob('*.json'):
+        try:
+            snapshots[path.stem] = (json.loads(path.read_text()),
+                                    path.stat().st_mtime >= limit)
+        except (OSError, ValueError):
+            logger.exception("Unable to read the metrics of %s", path)
+    return snapshots
+
+
+def merge(snapshots: Dict[str, tuple]) -> Dict[str, dict]:
+    """Metrics of every process: counters and histograms summed, gauges of
+    the live processes labelled with their pid."""
+    merged = {}
+    for pid, (metrics, live) in sorted(snapshots.items()):
+        for name, metric in metrics.items():
+            target = merged.setdefault(name, {
+                'type': metric['type'], 'description': metric['description'],
+                'samples': {}})
+            values = target['samples']
+            for sample, labels, value in metric['samples']:
+                labels = tuple(tuple(label) for label in labels)
+                if metric['type'] == 'gauge':
+                    if live:
+                        values[sample, labels + (('pid', pid),)] = value
+                else:
+                    values[sample, labels] = \
+                        values.get((sample, labels), 0) + value
+    for metric in merged.values():
+        metric['samples'] = [(sample, labels, value) for (sample, labels),
+                             value in metric['samples'].items()]
+    return merged
+
+
+async def render(directory=None, max_age: float = 15) -> str:
+    """Text exposition format of every registered metric, merged with
+    those published in ``directory`` by the other processes."""
+    if directory is None:
+        metrics = await snapshot()
+    else:
+        await write_snapshot(directory)
+        metrics = merge(read_snapshots(directory, max_age))
+    lines = []
+    for name, metric in metrics.items():
+        lines.append(f'# HELP {name} {metric["description"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        for sample, labels, value in metric['samples']:
+            lines.append(f'{sample}{_format_labels(labels)} '
+                         f'{_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,103 @@
+"""Request latency middleware and MongoDB command listener."""
+import time
+from threading import Lock
+
+from pymongo import monitoring
+
+from app.metrics import counter, gauge, histogram
+
+
+http_requests = histogram(
+    'http_request_duration_seconds',
+    "Time spent answering HTTP requests, by route template")
+mongodb_commands = histogram(
+    'mongodb_command_duration_seconds',
+    "Duration of the MongoDB commands, by collection and command")
+mongodb_failures = counter(
+    'mongodb_command_failures_total',
+    "MongoDB commands which failed, by collection and command")
+startup_seconds = gauge(
+    'app_startup_seconds',
+    "Time spent starting the application, by phase: import, init_beanie, "
+    "indexes and the whole startup event")
+
+
+class MetricsMiddleware:
+    """Observe the latency of every request under its route template.
+
+    Using the template (``/v1/invoices/{invoice_id}``) rather than the
+    path keeps one series per route. Streamed responses are measured until
+    their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.templates = {}
+
+    def template(self, scope):
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if endpoint not in self.templates:
+            router = scope['app'].router
+            for route in router.routes:
+                if getattr(route, 'endpoint', None) is endpoint:
+                    self.templates[endpoint] = route.path
+                    break
+            else:
+                return 'unmatched'
+        return self.templates[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests.observe(time.perf_counter() - started,
+                                  method=scope['method'],
+                                  route=self.template(scope),
+                                  status=status)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Record the duration of the commands sent by the Motor client."""
+
+    def __init__(self):
+        self.collections = {}
+        self._lock = Lock()
+
+    def started(self, event):
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        else:
+            collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        with self._lock:
+            self.collections[event.connection_id, event.request_id] = \
+                collection
+
+    def _labels(self, event):
+        with self._lock:
+            collection = self.collections.pop(
+                (event.connection_id, event.request_id), '')
+        return {'command': event.command_name, 'collection': collection}
+
+    def succeeded(self, event):
+        mongodb_commands.observe(event.duration_micros / 1e6,
+                                 **self._labels(event))
+
+    def failed(self, event):
+        labels = self._labels(event)
+        mongodb_commands.observe(event.duration_micros / 1e6, **labels)
+        mongodb_failures.inc(**labels)
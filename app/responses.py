@@ -1,9 +1,49 @@
 """Wrapper for responses."""
+from decimal import Decimal
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 
 
 CREATED = (201, {"description": "Created"})
 ACCEPTED = (202, {"description": "Accepted"})
+MULTI_STATUS = (207, {"description": "Some items were not created"})
+NOT_MODIFIED = (304, {"description": "Not modified"})
 UNAUTHORIZED = (401, {"description": "Unauthorized"})
 FORBIDDEN = (403, {"description": "Forbidden"})
 NOT_FOUND = (404, {"description": "Not found"})
 CONFLICT = (409, {"description": "Conflict"})
+PRECONDITION_FAILED = (412, {"description": "Precondition failed"})
+NOTHING_CREATED = (422, {"description": "No item was created"})
+
+
+def orjson_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.dict(by_alias=True)
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def dumps(content) -> bytes:
+    """Encode content to JSON, documents and ObjectIds included."""
+    return orjson.dumps(content, default=orjson_default,
+                        option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson.
+
+    Used as the default response class. Routes returning documents can
+    hand them over directly to skip ``jsonable_encoder``: they are
+    converted with ``dict(by_alias=True)``, as the response models would.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -7,7 +7,30 @@ PROJECT_PATH = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_PATH / '.env')
 
 
-DEBUG = True
+# Development mode: a single process reloaded on code changes, and emails
+# logged instead of sent.
+DEBUG = os.environ.get('DEBUG', '0') == '1'
+
+# Production server, see main.py. Each worker is a separate process with
+# its own Mongo pool and PDF workers. The event loop and HTTP parser are
+# uvloop and httptools when installed ('auto').
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 5000))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 1))
+SERVER_LOOP = os.environ.get('SERVER_LOOP', 'auto')
+SERVER_HTTP = os.environ.get('SERVER_HTTP', 'auto')
+SERVER_KEEP_ALIVE = int(os.environ.get('SERVER_KEEP_ALIVE', 5))
+SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', 2048))
+# Requests handled at once by a worker before answering 503, unlimited
+# when unset.
+SERVER_LIMIT_CONCURRENCY = int(os.environ['SERVER_LIMIT_CONCURRENCY']) \
+    if os.environ.get('SERVER_LIMIT_CONCURRENCY') else None
+# Number of processes serving the application, exported by main.py to the
+# workers it starts. With more than one, the caches local to a process
+# keep their entries for a short time by default, since an invalidation
+# only reaches the process handling the change, and the metrics are merged
+# through METRICS_DIR.
+SERVER_PROCESSES = int(os.environ.get('SERVER_PROCESSES', 1))
 
 
 APP_URL = os.environ.get('APP_URL', 'http://localhost:5000')
@@ -34,7 +57,10 @@ DATABASES = {
         "user": os.environ.get('DATABASE.USER', 'admin'),
         "password": os.environ.get('DATABASE.PASSWORD', 'password'),
         "url": "mongodb://{user}:{password}@{host}:{port}",
-        "database_name": "mes-factures-autoentrepreneur"
+        "database_name": "mes-factures-autoentrepreneur",
+        # Connections per server worker.
+        "max_pool_size": int(os.environ.get('DATABASE.MAX_POOL_SIZE', 100)),
+        "min_pool_size": int(os.environ.get('DATABASE.MIN_POOL_SIZE', 0)),
     }
 }
 
@@ -43,18 +69,96 @@ BEANIE_DOCUMENTS = [
     "app.core.documents.Invoice",
     "app.core.documents.Quotation",
     "app.core.documents.Customer",
-    "app.core.documents.S3Link"
+    "app.core.documents.S3Link",
+    "app.core.documents.ReferenceCounter",
+    "app.core.documents.PdfJob",
+    "app.core.documents.PrestationStat",
+    "app.core.documents.RevenueMonth",
 ]
 
 JWT_TOKEN_LIFETIME = os.environ.get('JWT_TOKEN_LIFETIME', 3600)
 
+USER_CACHE_BACKEND = os.environ.get(
+    'USER_CACHE_BACKEND', 'app.users.cache.InMemoryUserCache')
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.environ.get(
+    'USER_CACHE_TTL', 300 if SERVER_PROCESSES == 1 else 30))
+
 AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
 AWS_BUCKET_NAME = os.environ.get("AWS_BUCKET_NAME")
+AWS_REGION = os.environ.get("AWS_REGION", "eu-west-3")
+# Point to a local S3 stand-in (moto server, MinIO...) in development.
+AWS_S3_ENDPOINT_URL = os.environ.get("AWS_S3_ENDPOINT_URL")
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 32))
+# Sizes in MB
+AWS_MULTIPART_THRESHOLD = int(os.environ.get("AWS_MULTIPART_THRESHOLD", 8))
+AWS_MULTIPART_CHUNKSIZE = int(os.environ.get("AWS_MULTIPART_CHUNKSIZE", 8))
+AWS_TRANSFER_CONCURRENCY = int(os.environ.get("AWS_TRANSFER_CONCURRENCY", 4))
+
+# Lifetime in seconds of the presigned PDF links, and how long before their
+# expiration a new one is signed.
+PUBLIC_LINK_EXPIRATION = int(os.environ.get("PUBLIC_LINK_EXPIRATION", 3600))
+PUBLIC_LINK_REFRESH_MARGIN = int(
+    os.environ.get("PUBLIC_LINK_REFRESH_MARGIN", 300))
+PUBLIC_LINK_CACHE_SIZE = int(os.environ.get("PUBLIC_LINK_CACHE_SIZE", 10000))
+# How long a process serves a link from its cache, at most until the link
+# must be refreshed.
+PUBLIC_LINK_CACHE_TTL = float(os.environ.get(
+    "PUBLIC_LINK_CACHE_TTL",
+    PUBLIC_LINK_EXPIRATION if SERVER_PROCESSES == 1 else 30))
+
+# Directory shared by the server processes, where each one writes its
+# metrics for /metrics to report those of every process.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
 
 
 SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY")
 SENDGRID_EMAIL_SEND_URL = os.environ.get("SENDGRID_EMAIL_SEND_URL")
 SENDGRID_FROM_EMAIL = os.environ.get("SENDGRID_FROM_EMAIL")
+EMAIL_TIMEOUT = float(os.environ.get('EMAIL_TIMEOUT', 10))
+EMAIL_CONCURRENCY = int(os.environ.get('EMAIL_CONCURRENCY', 4))
+EMAIL_QUEUE_SIZE = int(os.environ.get('EMAIL_QUEUE_SIZE', 1000))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+EMAIL_RETRY_DELAY = float(os.environ.get('EMAIL_RETRY_DELAY', 1))
+# Validity of the PDF links sent by email, a week at most with SigV4.
+EMAIL_LINK_EXPIRATION = int(os.environ.get('EMAIL_LINK_EXPIRATION', 604800))
+
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 1000))
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 200))
+
+# Annual turnover ceiling of the micro-entrepreneur regime, services.
+REVENUE_CEILING = float(os.environ.get('REVENUE_CEILING', 77700))
+
+# PDFs fetched ahead while streaming an archive, and how long to wait for
+# the missing ones to be rendered.
+ARCHIVE_CONCURRENCY = int(os.environ.get('ARCHIVE_CONCURRENCY', 4))
+ARCHIVE_RENDER_TIMEOUT = float(os.environ.get('ARCHIVE_RENDER_TIMEOUT', 300))
 
 LATEX_TEMP_DIR = PROJECT_PATH / "latex"
+# Format files holding the precompiled template preamble, one per template
+# version. Set LATEX_FORMAT to 0 to load the preamble on every render.
+LATEX_FORMAT = os.environ.get('LATEX_FORMAT', '1') == '1'
+LATEX_FORMAT_DIR = Path(os.environ.get('LATEX_FORMAT_DIR',
+                                       LATEX_TEMP_DIR / 'formats'))
+# Each render runs in its own scratch directory created here, tmpfs when
+# available.
+LATEX_SCRATCH_DIR = os.environ.get(
+    'LATEX_SCRATCH_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+# Bump to invalidate every cached PDF after a change in the templates.
+PDF_TEMPLATE_VERSION = os.environ.get('PDF_TEMPLATE_VERSION', '')
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+PDF_JOBS_PER_USER = int(os.environ.get('PDF_JOBS_PER_USER', 1))
+PDF_JOB_MAX_ATTEMPTS = int(os.environ.get('PDF_JOB_MAX_ATTEMPTS', 5))
+PDF_JOB_RETRY_DELAY = float(os.environ.get('PDF_JOB_RETRY_DELAY', 5))
+# A running job older than this is considered stalled and queued again.
+# Its process gives up on the render after half of it, and kills any
+# pdflatex run lasting more than PDF_RENDER_TIMEOUT.
+PDF_JOB_TIMEOUT = float(os.environ.get('PDF_JOB_TIMEOUT', 600))
+PDF_RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', 60))
+PDF_QUEUE_POLL_INTERVAL = float(os.environ.get('PDF_QUEUE_POLL_INTERVAL', 1))
+# How long a stopping process waits for its running PDF jobs before
+# queuing them again for another process.
+PDF_DRAIN_TIMEOUT = float(os.environ.get('PDF_DRAIN_TIMEOUT', 60))
@@ -1,7 +1,46 @@
+import time
+from typing import Optional
+
+import jwt
 from fastapi_users.authentication import JWTAuthentication
+from fastapi_users.jwt import decode_jwt
+from fastapi_users.manager import UserNotExists
+from pydantic import UUID4
+
 from app import settings
+from .cache import cache_hits, cache_misses, user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT authentication resolving users through the user cache.
+
+    The token is still decoded and verified on every request, only the
+    database lookup is skipped.
+    """
+
+    async def __call__(self, credentials: Optional[str], user_manager):
+        if credentials is None:
+            return None
+        try:
+            data = decode_jwt(credentials, self.secret, self.token_audience)
+            user_id = UUID4(data["user_id"])
+        except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+            return None
+        user = await user_cache.get(user_id, credentials)
+        if user is not None:
+            cache_hits.inc()
+            return user
+        cache_misses.inc()
+        try:
+            user = await user_manager.get(user_id)
+        except UserNotExists:
+            return None
+        await user_cache.set(user, credentials,
+                             ttl=data.get("exp", 0) - time.time())
+        return user
+
 
 token_lifetime = settings.JWT_TOKEN_LIFETIME
-jwt_authentication = JWTAuthentication(secret=settings.SECRET,
-                                       lifetime_seconds=token_lifetime,
-                                       tokenUrl="auth/jwt/login")
+jwt_authentication = CachedJWTAuthentication(secret=settings.SECRET,
+                                             lifetime_seconds=token_lifetime,
+                                             tokenUrl="auth/jwt/login")
@@ -0,0 +1,82 @@
+"""Cache of the authenticated users.
+
+Resolving the current user otherwise loads the user document from MongoDB
+on every request. Entries are keyed by user id and token, never outlive
+the token, and are dropped by the ``UserManager`` hooks whenever the user
+changes. The backend is chosen with the USER_CACHE_BACKEND setting.
+"""
+import importlib
+from abc import ABC, abstractmethod
+from typing import Optional
+from uuid import UUID
+
+from app import settings
+from app.cache import TTLCache
+from app.metrics import counter
+
+
+cache_hits = counter('user_cache_hits_total',
+                     "Authenticated users served from the cache")
+cache_misses = counter('user_cache_misses_total',
+                       "Authenticated users loaded from the database")
+
+
+class UserCache(ABC):
+    """Interface of the user cache backends."""
+
+    @abstractmethod
+    async def get(self, user_id: UUID, token: str):
+        pass
+
+    @abstractmethod
+    async def set(self, user, token: str, ttl: float):
+        pass
+
+    @abstractmethod
+    async def invalidate(self, user_id: UUID):
+        pass
+
+
+class NoUserCache(UserCache):
+
+    async def get(self, user_id, token):
+        return None
+
+    async def set(self, user, token, ttl):
+        pass
+
+    async def invalidate(self, user_id):
+        pass
+
+
+class InMemoryUserCache(UserCache):
+    """Bounded TTL/LRU cache local to the process.
+
+    Invalidations are rare, they scan the keys rather than keep an index
+    of the tokens of each user that would outlive the entries.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.entries = TTLCache(maxsize=maxsize or settings.USER_CACHE_SIZE,
+                                ttl=ttl or settings.USER_CACHE_TTL)
+
+    async def get(self, user_id, token):
+        return self.entries.get((user_id, token))
+
+    async def set(self, user, token, ttl):
+        self.entries.set((user.id, token), user,
+                         ttl=min(ttl, self.entries.ttl))
+
+    async def invalidate(self, user_id):
+        for key in self.entries.keys():
+            if key[0] == user_id:
+                self.entries.pop(key)
+
+
+def get_user_cache(backend: Optional[str] = None) -> UserCache:
+    module_name, class_name = (backend or settings.USER_CACHE_BACKEND)\
+        .rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+user_cache = get_user_cache()
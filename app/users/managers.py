@@ -1,9 +1,14 @@
-from typing import Optional
+import logging
+from typing import Any, Dict, Optional
 from fastapi import Request
 from fastapi_users import BaseUserManager
 from app import settings
 from .models import UserCreate, UserDB
 from .background_tasks import send_mail
+from .cache import user_cache
+
+
+logger = logging.getLogger(__name__)
 
 
 class UserManager(BaseUserManager[UserCreate, UserDB]):
@@ -14,17 +19,35 @@ class UserManager(BaseUserManager[UserCreate, UserDB]):
     async def on_after_register(self,
                                 user: UserDB,
                                 request: Optional[Request] = None):
-        print(f"User {user.id} has registered.")
+        logger.info("User %s has registered.", user.id)
 
     async def on_after_forgot_password(
         self, user: UserDB, token: str, request: Optional[Request] = None
     ):
-        print(f"User {user.id} forgot password. Reset token: {token}")
+        logger.info("User %s forgot password. Reset token: %s",
+                    user.id, token)
 
     async def on_after_request_verify(
         self, user: UserDB, token: str, request: Optional[Request] = None
     ):
-        print(f"Verification {user.id}. Verification token: {token}")
+        logger.info("Verification %s. Verification token: %s",
+                    user.id, token)
         content = f'Token:\n {token}'
         if not settings.DEBUG:
             await send_mail(user.email, "Vérification d'adress email", content)
+
+    async def on_after_update(self, user: UserDB, update_dict: Dict[str, Any],
+                              request: Optional[Request] = None):
+        await user_cache.invalidate(user.id)
+
+    async def on_after_verify(self, user: UserDB,
+                              request: Optional[Request] = None):
+        await user_cache.invalidate(user.id)
+
+    async def on_after_reset_password(self, user: UserDB,
+                                      request: Optional[Request] = None):
+        await user_cache.invalidate(user.id)
+
+    async def delete(self, user: UserDB) -> None:
+        await super().delete(user)
+        await user_cache.invalidate(user.id)
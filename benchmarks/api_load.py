@@ -0,0 +1,364 @@
+"""Load test the API and compare the latencies with a stored baseline.
+
+Seed a scratch database with synthetic users, customers and invoices,
+then drive the ASGI application in process through ``httpx`` with S3 and
+LaTeX replaced by stubs, so only the API and the database are measured.
+Each scenario reports the p50/p95/p99 latencies and the throughput. The
+exit status is non-zero if a scenario regressed past the baseline, or if
+the baseline has no entry for it.
+
+The database is an in-process stand-in (``--backend memory``, the
+default, needs ``mongomock-motor``) or a local mongod (``--backend
+mongod``, see ``DB_URL``).
+
+Latencies depend on the machine, so the committed baseline only gives
+orders of magnitude. To gate a change, record a reference run of the
+previous code on the same machine, then compare with it. The p95 and p99
+latencies are noisier than the median and get a wider tolerance.
+
+Usage::
+
+    python -m benchmarks.api_load --size 1k
+    # Reference run of the previous code, then of the change:
+    python -m benchmarks.api_load --baseline /tmp/ref.json --save-baseline
+    python -m benchmarks.api_load --baseline /tmp/ref.json
+    python -m benchmarks.api_load --size 100k --backend mongod \
+        --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from botocore.exceptions import ClientError
+from bson import ObjectId
+
+from app import settings
+from app.core.models import Prestation
+from app.core.money import totals
+from app.core.utils import customer_fingerprint
+
+
+BENCH_DATABASE = 'mes-factures-autoentrepreneur-bench'
+BASELINE = Path(__file__).parent / 'baseline.json'
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+SEED_BATCH = 10000
+PASSWORD = 'benchmark'
+
+
+def parse_size(value):
+    return SIZES.get(value.lower()) or int(value)
+
+
+class StubS3Client:
+    """Stands in for the boto3 client: signs nothing, stores names."""
+
+    def __init__(self):
+        self.objects = set()
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.invalid/{Params['Key']}?expires={ExpiresIn}"
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, Config=None):
+        self.objects.add(Key)
+
+
+def stub_render_pdf(invoice_data, issuer, customer, invoice_name=None):
+    """Replaces the LaTeX build in the worker processes."""
+    return invoice_name or uuid.uuid4().hex, 0.0, 0.0
+
+
+def install_stubs():
+    from app.core import jobs, utils
+    utils._s3_client = StubS3Client()
+    jobs.render_pdf = stub_render_pdf
+
+
+def get_client(backend):
+    if backend == 'memory':
+        try:
+            import mongomock_motor
+        except ImportError:
+            sys.exit("--backend memory needs mongomock-motor")
+        return mongomock_motor.AsyncMongoMockClient()
+    from app.db import get_mongodb_client
+    return get_mongodb_client()
+
+
+async def seed(db, user_id, size, users, customers_per_user):
+    """Spread ``size`` invoices over ``users`` users, the first one being
+    the user the scenarios authenticate as."""
+    start = datetime.now() - timedelta(days=365)
+    user_ids = [user_id] + [uuid.uuid4() for _ in range(users - 1)]
+    per_user = max(size // users, 1)
+    customers = {}
+    for owner in user_ids:
+        documents = [{'_id': ObjectId(), 'user': owner, 'company': True,
+                      'name': f'Customer {i}',
+                      'email': f'customer{i}@example.com', 'version': 0}
+                     for i in range(customers_per_user)]
+        for document in documents:
+            document['fingerprint'] = customer_fingerprint(document)
+        await db.customers.insert_many(documents)
+        customers[owner] = [document['_id'] for document in documents]
+    step = timedelta(days=365) / per_user
+    for owner in user_ids:
+        batch = []
+        for i in range(per_user):
+            prestations = [Prestation(
+                title=random.choice(('Dev', 'Conseil', 'Formation')),
+                unit_price=random.choice((80, 350, 500)),
+                quantity=random.randint(1, 10)).dict()]
+            batch.append({
+                'reference': f'{start.year}-{i + 1:06d}',
+                'emited': start + step * i,
+                'issuer': owner,
+                'customer': random.choice(customers[owner]),
+                'prestations': prestations,
+                'filename': uuid.uuid4().hex,
+                'render_hash': None,
+                **totals(prestations),
+                'version': 0,
+            })
+            if len(batch) == SEED_BATCH:
+                await db.invoices.insert_many(batch)
+                batch = []
+        if batch:
+            await db.invoices.insert_many(batch)
+    return per_user
+
+
+async def prepare(client, args):
+    from app.core import migrations, stats
+    from app.main import app
+    email = 'benchmark@example.com'
+    response = await client.post('/auth/register', json={
+        'email': email, 'password': PASSWORD, 'first_name': 'Bench',
+        'last_name': 'Mark', 'company_name': 'Benchmark', 'siret': '0',
+        'intracom_vat': '0'})
+    response.raise_for_status()
+    user_id = uuid.UUID(response.json()['id'])
+    response = await client.post('/auth/jwt/login', data={
+        'username': email, 'password': PASSWORD})
+    response.raise_for_status()
+    client.headers['Authorization'] = \
+        f"Bearer {response.json()['access_token']}"
+    started = time.perf_counter()
+    per_user = await seed(app.db, user_id, args.size, args.users,
+                          args.customers)
+    await stats.rebuild_prestation_stats()
+    await stats.rebuild_revenue()
+    await migrations.seed_reference_counters()
+    print(f"Seeded {per_user * args.users} invoices ({per_user} for the "
+          f"benchmark user) in {time.perf_counter() - started:.1f} s")
+    invoices = await app.db.invoices.find(
+        {'issuer': user_id}, projection={'_id': True}, limit=1000
+    ).to_list(None)
+    customer = await app.db.customers.find_one({'user': user_id})
+    # Sign the links once: 'public_link' measures the cached links,
+    # 'public_link_uncached' the lookup and the signature.
+    for invoice in invoices:
+        response = await client.get(f"/v1/invoices/{invoice['_id']}/public")
+        response.raise_for_status()
+    response = await client.get('/v1/invoices?limit=50')
+    return {'invoices': [str(i['_id']) for i in invoices],
+            'customer': str(customer['_id']),
+            'list_etag': response.headers['ETag']}
+
+
+def scenarios(context):
+    from app.core.links import links
+    invoices = context['invoices']
+
+    def pick(i):
+        return invoices[i % len(invoices)]
+
+    def uncached_link(client, i):
+        links.clear()
+        return client.get(f'/v1/invoices/{pick(i)}/public')
+
+    return {
+        'list': lambda client, i: client.get('/v1/invoices?limit=50'),
+        'list_not_modified': lambda client, i: client.get(
+            '/v1/invoices?limit=50',
+            headers={'If-None-Match': context['list_etag']}),
+        'list_fields': lambda client, i: client.get(
+            '/v1/invoices?limit=50&fields=reference,emited,'
+            'total_without_charge'),
+        'detail': lambda client, i: client.get(f'/v1/invoices/{pick(i)}'),
+        'create': lambda client, i: client.post('/v1/invoices', json={
+            'customer': context['customer'],
+            'prestations': [{'title': 'Dev', 'unit_price': 500,
+                             'quantity': 1, 'vat': 20}]}),
+        'update': lambda client, i: client.patch(
+            f'/v1/invoices?invoice_id={pick(i)}',
+            json={'prestations': [{'title': 'Dev', 'unit_price': 500,
+                                   'quantity': i % 5 + 1}]}),
+        'prestations': lambda client, i: client.get('/v1/prestations'),
+        'revenue': lambda client, i: client.get('/v1/revenue'),
+        'public_link': lambda client, i: client.get(
+            f'/v1/invoices/{pick(i)}/public'),
+        'public_link_uncached': uncached_link,
+        'generate': lambda client, i: client.get(
+            f'/v1/invoices/{pick(i)}/generate'),
+    }
+
+
+def check(response):
+    if response.status_code != 304:
+        response.raise_for_status()
+
+
+def percentile(values, rank):
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+async def measure(client, scenario, requests, concurrency, warmup):
+    for i in range(warmup):
+        check(await scenario(client, i))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await scenario(client, warmup + i)
+            latencies.append(time.perf_counter() - started)
+            check(response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'throughput': round(requests / elapsed, 1)}
+
+
+async def wait_for_pdf_jobs(db, timeout=60):
+    """Time taken by the worker to drain the jobs queued by 'generate'."""
+    from app.core.models import JobStatus
+    started = time.perf_counter()
+    pending = {'status': {'$in': [JobStatus.queued.value,
+                                  JobStatus.running.value]}}
+    while await db.pdf_jobs.count_documents(pending):
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("PDF jobs were not processed")
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+def compare(results, baseline, tolerance, tail_tolerance=None):
+    """Names of the metrics worse than the baseline by more than the
+    tolerance, or ``tail_tolerance`` for the p95 and p99 latencies."""
+    if tail_tolerance is None:
+        tail_tolerance = tolerance
+    allowed = {'p50': tolerance, 'p95': tail_tolerance,
+               'p99': tail_tolerance}
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            regressions.append(f'{name} (no baseline)')
+            continue
+        for metric, metric_tolerance in allowed.items():
+            if result[metric] > reference[metric] * (1 + metric_tolerance):
+                regressions.append(f'{name}.{metric}')
+        if result['throughput'] < reference['throughput'] / (1 + tolerance):
+            regressions.append(f'{name}.throughput')
+    return regressions
+
+
+async def run(args):
+    from app import main
+    client = get_client(args.backend)
+    await client.drop_database(BENCH_DATABASE)
+    settings.DATABASES['mongodb']['database_name'] = BENCH_DATABASE
+    main.get_mongodb_client = lambda: client
+    install_stubs()
+    app = main.app
+    await app.router.startup()
+    results = {}
+    try:
+        async with httpx.AsyncClient(app=app, base_url='http://bench',
+                                     timeout=None) as http:
+            context = await prepare(http, args)
+            selected = scenarios(context)
+            for name in args.scenarios or selected:
+                results[name] = await measure(
+                    http, selected[name], args.requests, args.concurrency,
+                    args.warmup)
+                result = results[name]
+                print(f"{name:<20} p50 {result['p50']:8.2f} ms  "
+                      f"p95 {result['p95']:8.2f} ms  "
+                      f"p99 {result['p99']:8.2f} ms  "
+                      f"{result['throughput']:8.1f} req/s")
+            if 'generate' in results:
+                drained = await wait_for_pdf_jobs(app.db)
+                print(f"PDF jobs drained {drained:.2f} s after the last "
+                      f"'generate' request")
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=parse_size, default='1k',
+                        help="Invoices seeded in total: 1k, 100k, 1m or a "
+                             "number")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--customers', type=int, default=20,
+                        help="Customers seeded per user")
+    parser.add_argument('--backend', choices=('memory', 'mongod'),
+                        default='memory')
+    parser.add_argument('--requests', type=int, default=200,
+                        help="Requests measured per scenario")
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--scenario', dest='scenarios', action='append',
+                        help="Run only this scenario, can be repeated")
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Allowed slowdown of the median latency and "
+                             "of the throughput, 0.5 = 50%%")
+    parser.add_argument('--tail-tolerance', type=float, default=1.0,
+                        help="Allowed slowdown of the p95 and p99 "
+                             "latencies")
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args(argv)
+    results = asyncio.run(run(args))
+    key = f'{args.backend}-{args.size}'
+    baselines = json.loads(args.baseline.read_text()) \
+        if args.baseline.exists() else {}
+    if args.save_baseline:
+        baselines[key] = results
+        args.baseline.write_text(json.dumps(baselines, indent=2,
+                                            sort_keys=True) + '\n')
+        print(f"Saved the baseline {key} to {args.baseline}")
+        return
+    if key not in baselines:
+        sys.exit(f"No baseline {key} in {args.baseline}, record one with "
+                 f"--save-baseline")
+    regressions = compare(results, baselines[key], args.tolerance,
+                          args.tail_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
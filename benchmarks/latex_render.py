@@ -0,0 +1,76 @@
+"""Compare PDF renders per second with and without the format file.
+
+Renders the same synthetic invoice repeatedly through the render engine of
+the PDF workers, once starting pdflatex from the precompiled preamble and
+once loading the preamble on every run. Each render gets its own scratch
+directory, as in the workers. Nothing is uploaded. Needs pdflatex and the
+``mylatexformat`` package (texlive-latex-extra).
+
+Usage::
+
+    python -m benchmarks.latex_render --renders 20 --prestations 30
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import date
+
+from invoice_generator import models
+
+from app.core import latex
+
+
+def sample_invoice(prestations):
+    issuer = models.Issuer(first_name='Bench', last_name='Mark',
+                           company_name='Benchmark', siret='0',
+                           intracom_vat='0', email='bench@example.com')
+    customer = models.Customer(name='ACME', email='acme@example.com')
+    return models.Invoice(
+        reference='2021-000001', emited=date.today(), issuer=issuer,
+        customer=customer,
+        prestations=[models.Prestation(title=f'Prestation {i}',
+                                       unit_price=350, quantity=i % 5 + 1,
+                                       vat=20)
+                     for i in range(prestations)])
+
+
+def measure(invoice, renders, use_format):
+    durations = []
+    for _ in range(renders):
+        started = time.perf_counter()
+        with latex.scratch_directory() as directory:
+            latex.render_invoice(invoice, directory, use_format=use_format)
+        durations.append(time.perf_counter() - started)
+    return {'median': statistics.median(durations),
+            'renders_per_second': renders / sum(durations)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=20,
+                        help="Renders measured in each mode")
+    parser.add_argument('--prestations', type=int, default=10,
+                        help="Lines of the rendered invoice")
+    args = parser.parse_args(argv)
+    invoice = sample_invoice(args.prestations)
+    started = time.perf_counter()
+    with latex.scratch_directory() as directory:
+        renderer = latex.render_invoice(invoice, directory, use_format=True)
+    if renderer.format_file is None:
+        sys.exit("The format file could not be built, see the log")
+    print(f"First render, format file included: "
+          f"{time.perf_counter() - started:.2f} s")
+    results = {}
+    for name, use_format in (('without format', False),
+                             ('with format', True)):
+        results[name] = result = measure(invoice, args.renders, use_format)
+        print(f"{name:<15} median {result['median'] * 1000:8.1f} ms  "
+              f"{result['renders_per_second']:6.2f} renders/s")
+    speedup = results['with format']['renders_per_second'] \
+        / results['without format']['renders_per_second']
+    print(f"Speedup: x{speedup:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Check that every per-user query path is served by an index.
+
+Seed a scratch database with synthetic invoices, quotations, customers and
+S3 links, reconcile the declared indexes, then explain each query the API
+runs and time it. The exit status is non-zero if a winning plan scans a
+whole collection.
+
+Usage::
+
+    python -m benchmarks.query_plans --users 20 --invoices 500
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pymongo
+from bson import ObjectId
+
+from app.db import get_mongodb_client, init_db
+
+
+def plan_stages(plan):
+    stages = [plan['stage']]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages += plan_stages(child)
+    return stages
+
+
+async def seed(db, users, invoices_per_user):
+    for name in ('invoices', 'quotations', 'customers', 's3_links'):
+        await db[name].delete_many({})
+    start = datetime(2020, 1, 1)
+    user_ids = [uuid.uuid4() for _ in range(users)]
+    for user_id in user_ids:
+        customers = [{'_id': ObjectId(), 'user': user_id, 'company': True,
+                      'name': f'Customer {i}'} for i in range(10)]
+        await db.customers.insert_many(customers)
+        for collection in ('invoices', 'quotations'):
+            documents = [{
+                '_id': ObjectId(),
+                'reference': f'{2020 + i // 1000}-{i:03d}',
+                'emited': start + timedelta(hours=i * 7),
+                'issuer': user_id,
+                'customer': random.choice(customers)['_id'],
+                'prestations': [{'title': 'Dev', 'unit_price': 500.0,
+                                 'quantity': 1.0, 'vat': 0.0,
+                                 'total': 500.0}],
+                'filename': str(uuid.uuid4()),
+                'total_without_charge': 500.0,
+            } for i in range(invoices_per_user)]
+            await db[collection].insert_many(documents)
+        await db.s3_links.insert_many([
+            {'document': d['_id'], 'created': datetime.now(), 'url': None}
+            for d in documents[:10]])
+    return user_ids
+
+
+def query_paths(user_id, invoice, customer_name, document_id):
+    desc = pymongo.DESCENDING
+    keyset = {'$or': [{'emited': {'$lt': invoice['emited']}},
+                      {'emited': invoice['emited'],
+                       '_id': {'$lt': invoice['_id']}}]}
+    yield ('invoices', 'list first page', {'issuer': user_id},
+           [('emited', desc), ('_id', desc)], 51)
+    yield ('invoices', 'list after cursor',
+           {'$and': [{'issuer': user_id}, keyset]},
+           [('emited', desc), ('_id', desc)], 51)
+    yield ('invoices', 'last invoice', {'issuer': user_id},
+           [('emited', desc)], 1)
+    yield ('invoices', 'by reference',
+           {'issuer': user_id, 'reference': invoice['reference']}, None, 1)
+    yield ('quotations', 'list first page', {'issuer': user_id},
+           [('emited', desc), ('_id', desc)], 51)
+    yield ('customers', 'list first page', {'user': user_id},
+           [('_id', desc)], 51)
+    yield ('customers', 'by name',
+           {'user': user_id, 'name': customer_name}, None, 1)
+    yield ('s3_links', 'by document', {'document': document_id}, None, 1)
+
+
+async def run(users, invoices_per_user, repeat):
+    client = get_mongodb_client()
+    db, reports = await init_db(client, 'mes-factures-autoentrepreneur-bench')
+    for report in reports:
+        print(report.json())
+    user_ids = await seed(db, users, invoices_per_user)
+    user_id = user_ids[0]
+    invoice = await db.invoices.find_one({'issuer': user_id}, skip=10)
+    customer = await db.customers.find_one({'user': user_id})
+    link = await db.s3_links.find_one({})
+    failures = 0
+    paths = query_paths(user_id, invoice, customer['name'], link['document'])
+    for collection, label, query, sort, limit in paths:
+        cursor = db[collection].find(query, sort=sort, limit=limit)
+        explain = await cursor.explain()
+        stages = plan_stages(explain['queryPlanner']['winningPlan'])
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await db[collection].find(query, sort=sort, limit=limit)\
+                .to_list(None)
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+        ok = 'IXSCAN' in stages and 'COLLSCAN' not in stages
+        failures += not ok
+        print(f"{'ok ' if ok else 'BAD'} {collection:<11} {label:<18} "
+              f"{elapsed:8.3f} ms  {' <- '.join(stages)}")
+    client.close()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--invoices', type=int, default=500,
+                        help="Invoices and quotations seeded per user")
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args(argv)
+    failures = asyncio.run(run(args.users, args.invoices, args.repeat))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
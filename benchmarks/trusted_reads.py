@@ -0,0 +1,95 @@
+"""Per-document cost of reading invoices with and without the validators.
+
+Builds synthetic invoices as they come off a Motor cursor, then times
+turning them into ``Invoice`` documents and JSON, once through
+``parse_obj`` and the validators, once through ``app.core.trusted``. No
+query is measured, the database is only needed to initialise Beanie: a
+local mongod (``--backend mongod``) or an in-process stand-in
+(``--backend memory``, needs ``mongomock-motor``).
+
+Usage::
+
+    python -m benchmarks.trusted_reads --documents 10000 --prestations 20
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from beanie import init_beanie
+from bson import ObjectId
+
+from app.core import trusted
+from app.core.documents import Invoice
+from app.core.models import Prestation
+from app.core.money import totals
+from app.responses import dumps
+from benchmarks.api_load import BENCH_DATABASE, get_client
+
+
+def raw_invoices(documents, prestations):
+    issuer = uuid.uuid4()
+    start = datetime.now() - timedelta(days=365)
+    invoices = []
+    for i in range(documents):
+        lines = [Prestation(title='Dev',
+                            unit_price=random.choice((80, 350, 500)),
+                            quantity=random.randint(1, 10),
+                            vat=random.choice((0, 20))).dict()
+                 for _ in range(prestations)]
+        invoices.append({
+            '_id': ObjectId(), 'reference': f'{start.year}-{i + 1:06d}',
+            'emited': start + timedelta(minutes=i), 'issuer': issuer,
+            'customer': ObjectId(), 'prestations': lines,
+            'filename': None, 'render_hash': None, **totals(lines),
+            'version': 0})
+    return invoices
+
+
+def measure(build, invoices):
+    """Microseconds per document to build it, then to build and encode
+    it."""
+    started = time.perf_counter()
+    documents = [build(invoice) for invoice in invoices]
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    for document in documents:
+        dumps(document)
+    encoded = time.perf_counter() - started
+    return (built * 1e6 / len(invoices),
+            (built + encoded) * 1e6 / len(invoices))
+
+
+async def run(args):
+    client = get_client(args.backend)
+    await init_beanie(database=client[BENCH_DATABASE],
+                      document_models=[Invoice])
+    invoices = raw_invoices(args.documents, args.prestations)
+    modes = {
+        'validated': Invoice.parse_obj,
+        'trusted': lambda invoice: trusted.construct(Invoice, invoice),
+    }
+    results = {name: measure(build, invoices)
+               for name, build in modes.items()}
+    for name, (built, encoded) in results.items():
+        print(f"{name:<10} build {built:8.2f} us/doc  "
+              f"build + JSON {encoded:8.2f} us/doc")
+    speedup = results['validated'][1] / results['trusted'][1]
+    print(f"Speedup, build + JSON: x{speedup:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--prestations', type=int, default=10,
+                        help="Prestations per invoice")
+    parser.add_argument('--backend', choices=('mongod', 'memory'),
+                        default='mongod')
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,53 @@
-"""Entry point for the project."""
+"""Entry point for the project.
+
+With ``DEBUG=1`` a single process reloads on code changes. Otherwise the
+application runs in ``SERVER_WORKERS`` processes, see ``app.settings``.
+Each process caches the authenticated users and the public links, and
+only its own cache is cleared when they change: with several processes,
+entries last ``USER_CACHE_TTL`` and ``PUBLIC_LINK_CACHE_TTL`` seconds
+(30 by default) so the others catch up quickly.
+"""
+import os
+import tempfile
+from pathlib import Path
+
 import uvicorn
-from app.settings import DEBUG
+from app import settings
+
+
+def server_options():
+    options = {
+        'host': settings.SERVER_HOST,
+        'port': settings.SERVER_PORT,
+        'log_level': 'info',
+    }
+    if settings.DEBUG:
+        return {**options, 'reload': True}
+    return {
+        **options,
+        'workers': settings.SERVER_WORKERS,
+        'loop': settings.SERVER_LOOP,
+        'http': settings.SERVER_HTTP,
+        'timeout_keep_alive': settings.SERVER_KEEP_ALIVE,
+        'backlog': settings.SERVER_BACKLOG,
+        'limit_concurrency': settings.SERVER_LIMIT_CONCURRENCY,
+    }
+
+
+def export_processes(workers, environ=os.environ):
+    """Tell the server processes, through the environment they inherit,
+    how many they are and where to share their metrics."""
+    environ['SERVER_PROCESSES'] = str(workers)
+    if workers > 1:
+        directory = environ.get('METRICS_DIR') \
+            or tempfile.mkdtemp(prefix='metrics-')
+        # Counters of a previous run would be added to the new ones.
+        for path in Path(directory).glob('*.json'):
+            path.unlink()
+        environ['METRICS_DIR'] = directory
 
 
 if __name__ == "__main__":
-    uvicorn.run("app:app",
-                host="0.0.0.0",
-                port=5000,
-                log_level="info",
-                reload=DEBUG)
+    options = server_options()
+    export_processes(options.get('workers') or 1)
+    uvicorn.run("app:app", **options)
@@ -0,0 +1,33 @@
+"""Maintenance commands for the project."""
+import argparse
+import asyncio
+import logging
+
+from app.db import get_mongodb_client, init_db
+from app.core import migrations, stats
+
+
+COMMANDS = {
+    'seed-reference-counters': migrations.seed_reference_counters,
+    'rebuild-prestation-stats': stats.rebuild_prestation_stats,
+    'rebuild-revenue': stats.rebuild_revenue,
+    'deduplicate-customers': migrations.deduplicate_customers,
+    'store-amounts-in-cents': migrations.store_amounts_in_cents,
+}
+
+
+async def run(command):
+    client = get_mongodb_client()
+    try:
+        await init_db(client)
+        return await COMMANDS[command]()
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(run(args.command)))
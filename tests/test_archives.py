@@ -0,0 +1,57 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+from app import settings
+from app.core import archives
+
+
+class Body(io.BytesIO):
+    opened = []
+
+    def __init__(self, data):
+        super().__init__(data)
+        Body.opened.append(self)
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def test_bodies_are_closed_on_disconnect(monkeypatch):
+    invoices = [{'reference': f'2021-{i:03d}', 'filename': f'f{i}'}
+                for i in range(6)]
+    collection = SimpleNamespace(find=lambda *a, **kw: Cursor(invoices))
+    monkeypatch.setattr(archives, 'Invoice', SimpleNamespace(
+        get_motor_collection=lambda: collection))
+    monkeypatch.setattr(settings, 'ARCHIVE_CONCURRENCY', 3)
+    monkeypatch.setattr(archives, 'CHUNK_SIZE', 4)
+
+    async def get_body(name):
+        return Body(b'%PDF' * 4)
+
+    async def run(func, *args):
+        return func(*args)
+
+    monkeypatch.setattr(archives, 'get_object_body_async', get_body)
+    monkeypatch.setattr(archives, 'run_in_s3_executor', run)
+
+    async def scenario():
+        stream = archives.invoice_pdf_archive({}, None)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert len(Body.opened) == 4
+    assert all(body.closed for body in Body.opened)
@@ -0,0 +1,15 @@
+from app.core.bulk import bulk_status
+from app.core.models import BulkCreateResult, BulkItemResult
+
+
+def result(created, failed):
+    items = [BulkItemResult(index=i) for i in range(created)]
+    items += [BulkItemResult(index=created + i, error="Customer not found")
+              for i in range(failed)]
+    return BulkCreateResult(created=created, results=items)
+
+
+def test_bulk_status():
+    assert bulk_status(result(2, 0)) == 201
+    assert bulk_status(result(1, 1)) == 207
+    assert bulk_status(result(0, 2)) == 422
@@ -0,0 +1,38 @@
+from uuid import uuid4
+
+from app.core.migrations import missing_fields
+from app.core.utils import customer_fingerprint
+
+
+def customer(**fields):
+    return {'user': fields.pop('user', None), 'company': False,
+            'first_name': 'Ada', 'last_name': 'Lovelace',
+            'email': 'ada@example.com',
+            'address': {'address': '1 rue de la Paix', 'zip_code': 75002,
+                        'city': 'Paris'},
+            **fields}
+
+
+def test_fingerprint_ignores_case_and_spacing_but_not_the_owner():
+    user = uuid4()
+    original = customer(user=user)
+    duplicate = customer(user=user, first_name=' ada ',
+                         last_name='LOVELACE', phone='0102030405',
+                         address={'address': '1  rue de la paix',
+                                  'zip_code': 75002, 'city': 'PARIS'})
+    assert customer_fingerprint(duplicate) == customer_fingerprint(original)
+    assert customer_fingerprint(customer(user=uuid4())) \
+        != customer_fingerprint(original)
+    assert customer_fingerprint(customer(user=user, email='a@example.com')) \
+        != customer_fingerprint(original)
+
+
+def test_merge_keeps_the_fields_set_only_on_duplicates():
+    original = {'_id': 1, 'version': 2, 'phone': None, 'name': '',
+                'fingerprint': None, **customer()}
+    duplicate = {'_id': 2, 'version': 5, 'phone': '0102030405',
+                 'name': 'Analytical', 'fingerprint': 'f',
+                 **customer(first_name='ADA')}
+    assert missing_fields(original, duplicate) == {
+        'phone': '0102030405', 'name': 'Analytical'}
+    assert missing_fields(duplicate, original) == {}
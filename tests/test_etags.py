@@ -0,0 +1,59 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core.documents import Invoice
+from app.core.etags import (conditional_response, document_etag,
+                            etag_matches, if_match_version, page_etag)
+
+
+def test_document_etag_follows_version_and_fields():
+    invoice = Invoice.construct(id=ObjectId(), version=3)
+    etag = document_etag(invoice)
+    raw = {'_id': invoice.id, 'version': 3, 'reference': '2021-001'}
+    assert document_etag(raw) == etag
+    assert document_etag(raw, {'reference': True}) != etag
+    invoice.version += 1
+    assert document_etag(invoice) != etag
+
+
+def test_page_etag_changes_with_the_page():
+    documents = [{'_id': ObjectId()}, {'_id': ObjectId(), 'version': 2}]
+    etag = page_etag(documents, None)
+    assert page_etag(documents[:1], None) != etag
+    assert page_etag(documents, 'cursor') != etag
+    documents[0]['version'] = 1
+    assert page_etag(documents, None) != etag
+
+
+def test_etag_matches():
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('*', '"b"')
+    assert not etag_matches(None, '"b"')
+    assert not etag_matches('W/"b"', '"b"')
+    assert etag_matches('W/"b"', '"b"', weak=True)
+
+
+def test_conditional_response():
+    response = conditional_response({'a': 1}, '"x"', '"x"')
+    assert response.status_code == 304
+    assert response.body == b''
+    assert response.headers['etag'] == '"x"'
+    response = conditional_response({'a': 1}, '"x"', '"y"',
+                                    {'X-Next-Cursor': 'c'})
+    assert response.status_code == 200
+    assert response.body == b'{"a":1}'
+    assert response.headers['x-next-cursor'] == 'c'
+
+
+def test_if_match_version():
+    invoice = Invoice.construct(id=ObjectId(), version=3)
+    assert document_etag(invoice) == f'"{invoice.id}-3"'
+    assert if_match_version(None, invoice.id) is None
+    assert if_match_version('*', invoice.id) is None
+    assert if_match_version(document_etag(invoice), invoice.id) == 3
+    for stale in (document_etag(invoice, {'reference': True}),
+                  f'W/{document_etag(invoice)}', f'"{ObjectId()}-3"'):
+        with pytest.raises(HTTPException) as error:
+            if_match_version(stale, invoice.id)
+        assert error.value.status_code == 412
@@ -0,0 +1,28 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core.documents import Invoice
+from app.core.fields import FieldSelection, restrict
+from app.responses import dumps
+
+
+def test_projection_maps_names_to_aliases():
+    selection = FieldSelection('id, reference,prestations.title')
+    assert selection.projection(Invoice) == {
+        '_id': True, 'reference': True, 'prestations.title': True}
+    assert FieldSelection(None).projection(Invoice) is None
+
+
+def test_projection_rejects_unknown_fields():
+    with pytest.raises(HTTPException) as error:
+        FieldSelection('reference,nope').projection(Invoice)
+    assert error.value.status_code == 400
+
+
+def test_restrict_and_dumps():
+    document = {'_id': ObjectId('6ad4b09c3158a9374191ad43'),
+                'emited': None, 'prestations': [{'title': 'dev'}]}
+    data = restrict(document, {'prestations.title': True})
+    assert dumps(data) == (b'{"_id":"6ad4b09c3158a9374191ad43",'
+                           b'"prestations":[{"title":"dev"}]}')
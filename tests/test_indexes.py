@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.core.indexes import reconcile_collection
+
+
+class Collection:
+    name = 'invoices'
+
+    def __init__(self, existing, failing=()):
+        self.existing = existing
+        self.failing = failing
+        self.created = []
+
+    async def index_information(self):
+        return self.existing
+
+    async def create_indexes(self, indexes):
+        for index in indexes:
+            if index.document['name'] in self.failing:
+                raise OperationFailure("duplicate key")
+            self.created.append(index.document['name'])
+
+
+def model(collection, indexes):
+    return SimpleNamespace(
+        get_motor_collection=lambda: collection,
+        Collection=SimpleNamespace(declared_indexes=indexes))
+
+
+def test_missing_indexes_are_created_and_drifted_ones_reported():
+    collection = Collection(existing={
+        '_id_': {'key': [('_id', 1)]},
+        'issuer_1': {'key': [('issuer', 1)]},
+        'reference_1': {'key': [('reference', 1)]},
+        'legacy_1': {'key': [('legacy', 1)]},
+    }, failing={'customer_1'})
+    indexes = [
+        IndexModel([('issuer', ASCENDING)]),
+        IndexModel([('reference', ASCENDING)], unique=True),
+        IndexModel([('emited', ASCENDING)]),
+        IndexModel([('customer', ASCENDING)], unique=True),
+    ]
+    report = asyncio.run(reconcile_collection(model(collection, indexes)))
+    assert collection.created == ['emited_1']
+    assert report.created == ['emited_1']
+    assert report.drifted == ['reference_1']
+    assert report.failed == ['customer_1']
+    assert report.undeclared == ['legacy_1']
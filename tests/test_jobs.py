@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from app import settings
+from app.core.documents import PdfJob
+from app.core.jobs import PdfWorker
+from app.core.models import JobStatus
+
+
+class Collection:
+    def __init__(self, modified=1):
+        self.updates = []
+        self.modified = modified
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=self.modified)
+
+
+class SlowWorker(PdfWorker):
+    """Renders by sleeping in the process pool."""
+
+    collection = None
+
+    async def render(self, job):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, time.sleep, 30)
+
+
+class HangingWorker(PdfWorker):
+    """Renders forever, in the event loop."""
+
+    collection = None
+
+    async def render(self, job):
+        await asyncio.sleep(30)
+
+
+def test_stop_terminates_the_pool_and_requeues_running_jobs():
+    job = PdfJob.construct(id=ObjectId(), user=uuid.uuid4(), attempts=2,
+                           status=JobStatus.running)
+
+    async def scenario():
+        worker = SlowWorker(db=None, workers=1)
+        worker.collection = Collection()
+        worker.executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        worker.tasks.add(asyncio.create_task(worker.process(job)))
+        await asyncio.sleep(0.5)
+        processes = list(worker.executor._processes.values())
+        started = time.perf_counter()
+        await worker.stop(timeout=0.1)
+        processes[0].join(5)
+        return (worker.collection.updates, time.perf_counter() - started,
+                processes[0].is_alive())
+
+    updates, elapsed, alive = asyncio.run(scenario())
+    assert elapsed < 5 and not alive
+    assert updates == [(
+        {'_id': job.id, 'status': 'running', 'attempts': 2},
+        {'$set': {'status': 'queued',
+                  'available_at': updates[0][1]['$set']['available_at']},
+         '$inc': {'attempts': -1}})]
+
+
+def test_render_timeout_retries_the_job_of_this_claim(monkeypatch):
+    monkeypatch.setattr(settings, 'PDF_JOB_TIMEOUT', 0.2)
+    job = PdfJob.construct(id=ObjectId(), user=uuid.uuid4(), attempts=1,
+                           status=JobStatus.running)
+
+    async def scenario():
+        worker = HangingWorker(db=None, workers=1)
+        worker.collection = Collection()
+        await worker.process(job)
+        return worker
+
+    started = time.perf_counter()
+    worker = asyncio.run(scenario())
+    assert time.perf_counter() - started < 5
+    [(query, update)] = worker.collection.updates
+    assert query == {'_id': job.id, 'status': 'running', 'attempts': 1}
+    assert update['$set']['status'] == 'queued'
+    assert update['$set']['error'].startswith('TimeoutError')
+
+
+def test_outcome_of_a_lost_claim_is_dropped(caplog):
+    job = PdfJob.construct(id=ObjectId(), user=uuid.uuid4(), attempts=3,
+                           status=JobStatus.running)
+
+    async def render(job):
+        return 1.5
+
+    async def scenario():
+        worker = SlowWorker(db=None, workers=1)
+        worker.collection = Collection(modified=0)
+        worker.render = render
+        await worker.process(job)
+        return worker
+
+    worker = asyncio.run(scenario())
+    [(query, update)] = worker.collection.updates
+    assert query == {'_id': job.id, 'status': 'running', 'attempts': 3}
+    assert update['$set']['status'] == 'done'
+    assert 'claimed again' in caplog.text
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+import invoice_generator
+
+from app.core.latex import preamble, scratch_directory
+
+
+def test_template_preamble_can_be_precompiled():
+    templates = Path(invoice_generator.__file__).parent / 'templates'
+    head = preamble(templates)
+    assert head.startswith(r'\documentclass{invoice}')
+    assert r'\begin{document}' not in head
+
+
+def test_scratch_directory_is_removed():
+    with scratch_directory() as directory:
+        (directory / 'invoice.tex').write_text('')
+    assert not Path(directory).exists()
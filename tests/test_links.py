@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app import settings
+from app.cache import TTLCache
+from app.core import links
+from app.core.documents import S3Link
+
+
+class Documents:
+    """Invoices whose PDF was deleted since their link was cached."""
+
+    Collection = SimpleNamespace(name='invoices')
+    aggregations = 0
+
+    @classmethod
+    def aggregate(cls, pipeline):
+        cls.aggregations += 1
+
+        async def to_list():
+            return [{'_id': ObjectId(), 'filename': None}]
+        return SimpleNamespace(to_list=to_list)
+
+
+def test_fresh_for_keeps_a_margin_before_expiration():
+    link = S3Link.construct(created=datetime.now())
+    lifetime = settings.PUBLIC_LINK_EXPIRATION \
+        - settings.PUBLIC_LINK_REFRESH_MARGIN
+    assert lifetime - 5 < links.fresh_for(link) <= lifetime
+    old = S3Link.construct(created=datetime.now() - timedelta(
+        seconds=lifetime + 1))
+    assert links.fresh_for(old) < 0
+
+
+def test_cached_link_is_served_until_forgotten(monkeypatch):
+    monkeypatch.setattr(links, 'links', TTLCache(maxsize=10, ttl=60))
+    document_id = ObjectId()
+    cached = (S3Link.construct(id=ObjectId(), document=document_id,
+                               created=datetime.now()), '"etag"')
+    links.links.set(('invoices', document_id), cached)
+
+    async def scenario():
+        first = await links.get_document_link(Documents, document_id)
+        links.forget_link(Documents, document_id)
+        with pytest.raises(HTTPException) as error:
+            await links.get_document_link(Documents, document_id)
+        return first, error.value
+
+    first, error = asyncio.run(scenario())
+    assert first == cached
+    assert Documents.aggregations == 1
+    assert (error.status_code, error.detail) == (404, "PDF not generated")
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import mail, settings
+
+
+def stand_in(statuses):
+    """SendGrid stand-in answering with the given statuses in turn."""
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(statuses[min(len(requests), len(statuses)) - 1])
+
+    mail.get_http_client(transport=httpx.MockTransport(handler))
+    return requests
+
+
+@pytest.fixture(autouse=True)
+def sendgrid(monkeypatch):
+    monkeypatch.setattr(settings, 'SENDGRID_EMAIL_SEND_URL',
+                        'http://sendgrid.test/v3/mail/send')
+    monkeypatch.setattr(settings, 'EMAIL_RETRY_DELAY', 0)
+    yield
+    asyncio.run(mail.close_http_client())
+
+
+def test_mass_send_is_batched():
+    requests = stand_in([202])
+    recipients = [mail.recipient(f'user{i}@example.com', {'-i-': str(i)})
+                  for i in range(mail.MAX_PERSONALIZATIONS + 1)]
+    asyncio.run(mail.send(recipients, 'Subject', 'Hello -i-'))
+    assert [len(r['personalizations']) for r in requests] == \
+        [mail.MAX_PERSONALIZATIONS, 1]
+
+
+def test_unavailable_sendgrid_is_retried():
+    requests = stand_in([503, 429, 202])
+    asyncio.run(mail.send([mail.recipient('user@example.com')], 'S', 'C'))
+    assert len(requests) == 3
+
+
+def test_refused_email_is_not_retried():
+    requests = stand_in([400])
+    with pytest.raises(mail.MailError):
+        asyncio.run(mail.send([mail.recipient('user@example.com')], 'S', 'C'))
+    assert len(requests) == 1
+
+
+def test_queue_sends_in_background():
+    requests = stand_in([500, 202])
+
+    async def run():
+        queue = mail.MailQueue(concurrency=2)
+        await queue.start()
+        for i in range(5):
+            await mail.send([mail.recipient(f'u{i}@example.com')], 'S', 'C')
+        await queue.stop()
+
+    asyncio.run(run())
+    assert len(requests) == 6
+    assert mail.MailQueue.instance is None
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+from app.metrics import Gauge, Histogram, merge, render
+from app.monitoring import MongoCommandListener, mongodb_commands
+
+
+def test_histogram_samples_are_cumulative():
+    metric = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        metric.observe(value, route='/v1/invoices')
+    samples = {(name, labels[-1][1] if name.endswith('bucket') else None):
+               value for name, labels, value
+               in asyncio.run(metric.samples())}
+    assert samples[('latency_seconds_bucket', '0.1')] == 1
+    assert samples[('latency_seconds_bucket', '1')] == 2
+    assert samples[('latency_seconds_bucket', '+Inf')] == 3
+    assert samples[('latency_seconds_count', None)] == 3
+
+
+def test_gauge_function_is_called_at_scrape():
+    async def depth():
+        return {(('queue', 'pdf'),): 3}
+    metric = Gauge('depth', 'Depth', function=lambda: depth())
+    assert asyncio.run(metric.samples()) == [('depth', (('queue', 'pdf'),), 3)]
+
+
+def test_mongo_listener_labels_collection_and_command():
+    listener = MongoCommandListener()
+    started = SimpleNamespace(command_name='find', request_id=1,
+                              connection_id=('localhost', 27017),
+                              command={'find': 'invoices', 'filter': {}})
+    listener.started(started)
+    listener.succeeded(SimpleNamespace(
+        command_name='find', request_id=1,
+        connection_id=('localhost', 27017), duration_micros=1500))
+    key = (('collection', 'invoices'), ('command', 'find'))
+    assert mongodb_commands.values[key][1] >= 0.0015
+    text = asyncio.run(render())
+    assert 'mongodb_command_duration_seconds_count{collection="invoices",' \
+           'command="find"}' in text
+
+
+def test_merge_sums_counters_and_labels_gauges():
+    def snapshot(requests, running):
+        return {'requests_total': {'type': 'counter', 'description': 'R',
+                                   'samples': [['requests_total',
+                                                [['route', '/']],
+                                                requests]]},
+                'running': {'type': 'gauge', 'description': 'J',
+                            'samples': [['running', [], running]]}}
+    merged = merge({'1': (snapshot(2, 1), True),
+                    '2': (snapshot(3, 5), True),
+                    '3': (snapshot(4, 7), False)})
+    assert merged['requests_total']['samples'] == [
+        ('requests_total', (('route', '/'),), 9)]
+    assert merged['running']['samples'] == [
+        ('running', (('pid', '1'),), 1), ('running', (('pid', '2'),), 5)]
+
+
+def test_render_merges_the_published_snapshots(tmp_path):
+    other = tmp_path / '1.json'
+    other.write_text(json.dumps(
+        {'published_total': {'type': 'counter', 'description': 'P',
+                             'samples': [['published_total', [], 2]]}}))
+    text = asyncio.run(render(tmp_path))
+    assert 'published_total 2' in text
+    assert (tmp_path / f'{os.getpid()}.json').exists()
@@ -0,0 +1,44 @@
+import pytest
+from pydantic import ValidationError
+
+from app.core.models import Prestation
+from app.core.money import line_cents, to_cents, totals, vat_cents
+
+
+def test_cents_are_exact():
+    assert to_cents(10.1) == 1010
+    assert to_cents(0.1) + to_cents(0.2) == to_cents(0.3)
+    assert line_cents(1010, 3) == 3030
+    assert line_cents(333, 1.5) == 500
+    assert vat_cents(1250, 5.5) == 69
+
+
+def test_totals_per_vat_rate():
+    prestations = [Prestation(title='Dev', unit_price=10.1, quantity=3,
+                              vat=20),
+                   Prestation(title='Livre', unit_price=12.5, quantity=1,
+                              vat=5.5),
+                   Prestation(title='Conseil', unit_price=0.35, quantity=1,
+                              vat=20)]
+    assert prestations[0].total == 30.3
+    result = totals(prestations)
+    assert result['vat_breakdown'] == [
+        {'rate': 5.5, 'base_cents': 1250, 'vat_cents': 69},
+        {'rate': 20, 'base_cents': 3065, 'vat_cents': 613}]
+    assert result['total_without_charge_cents'] == 4315
+    assert result['total_without_charge'] == 43.15
+    assert result['total_vat_cents'] == 682
+    assert result['total_cents'] == 4997
+    assert totals([p.dict() for p in prestations]) == result
+
+
+@pytest.mark.parametrize('fields', [
+    {'unit_price': 'abc', 'quantity': 1},
+    {'unit_price': 10, 'quantity': 'abc'},
+    {'unit_price': 1e300, 'quantity': 1},
+    {'unit_price': 1e17, 'quantity': 1},
+    {'unit_price': 10, 'quantity': 1, 'vat': 1e300},
+])
+def test_invalid_prestations_are_validation_errors(fields):
+    with pytest.raises(ValidationError):
+        Prestation(title='Dev', **fields)
@@ -0,0 +1,83 @@
+import asyncio
+import base64
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from beanie import PydanticObjectId
+
+from app.core.pagination import (DEFAULT_PAGE_SIZE, PaginationParams,
+                                 SortOrder, build_query, decode_cursor,
+                                 encode_cursor, paginate)
+
+
+def test_cursor_round_trip():
+    values = [datetime(2021, 11, 3, 10, 15, 0, 123000), PydanticObjectId()]
+    assert decode_cursor(encode_cursor(values), 2) == values
+
+
+def test_invalid_cursor():
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor('not-a-cursor', 2)
+    assert exc.value.status_code == 400
+
+
+def test_invalid_object_id_in_cursor():
+    cursor = base64.urlsafe_b64encode(b'[{"o":"zz"}]').decode()
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor, 1)
+    assert exc.value.status_code == 400
+
+
+def test_build_query_after_cursor():
+    emited, _id = datetime(2021, 11, 3), PydanticObjectId()
+    params = PaginationParams(cursor=encode_cursor([emited, _id]), limit=10,
+                              order=SortOrder.desc, stream=False)
+    query, sort = build_query({'issuer': 1}, 'emited', params)
+    assert sort == [('emited', -1), ('_id', -1)]
+    assert query == {'$and': [
+        {'issuer': 1},
+        {'$or': [{'emited': {'$lt': emited}},
+                 {'emited': emited, '_id': {'$lt': _id}}]}
+    ]}
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.limited = None
+
+    def sort(self, sort):
+        return self
+
+    def limit(self, limit):
+        self.limited = limit
+        return self
+
+    async def to_list(self, length):
+        return self.documents[:self.limited]
+
+
+def fake_collection(documents):
+    collection = SimpleNamespace(find=lambda query, projection: FakeCursor(
+        documents))
+    return SimpleNamespace(get_motor_collection=lambda: collection)
+
+
+def test_listing_without_limit_or_cursor_returns_everything():
+    documents = [{'_id': PydanticObjectId(), 'reference': str(i),
+                  'version': 0} for i in range(DEFAULT_PAGE_SIZE + 10)]
+    params = PaginationParams(cursor=None, limit=None,
+                              order=SortOrder.desc, stream=False)
+    page, next_cursor, _ = asyncio.run(paginate(
+        fake_collection(documents), {}, params,
+        projection={'reference': True}))
+    assert len(page) == len(documents) and next_cursor is None
+
+    params = PaginationParams(cursor=None, limit=10, order=SortOrder.desc,
+                              stream=False)
+    page, next_cursor, _ = asyncio.run(paginate(
+        fake_collection(documents), {}, params,
+        projection={'reference': True}))
+    assert len(page) == 10 and next_cursor
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from app import settings
+from app.core.pdf_cache import render_hash
+
+INVOICE = {'reference': '2026-001', 'emited': datetime(2026, 3, 1),
+           'prestations': [{'title': 'Dev', 'unit_price': 10.1,
+                            'quantity': 3}]}
+ISSUER = {'company_name': 'Acme', 'rib': None}
+CUSTOMER = {'name': 'Customer', 'company': True}
+
+
+def test_hash_ignores_bookkeeping_fields():
+    expected = render_hash(INVOICE, ISSUER, CUSTOMER)
+    invoice = {**INVOICE, 'filename': 'abc', 'render_hash': expected,
+               'version': 7, 'issuer': 'someone', 'customer': 'other'}
+    customer = {**CUSTOMER, 'id': 'xyz', 'user': 'someone'}
+    assert render_hash(invoice, ISSUER, customer) == expected
+
+
+def test_hash_changes_with_the_content_and_the_template(monkeypatch):
+    expected = render_hash(INVOICE, ISSUER, CUSTOMER)
+    changed = {**INVOICE, 'prestations': [
+        {'title': 'Dev', 'unit_price': 10.1, 'quantity': 4}]}
+    assert render_hash(changed, ISSUER, CUSTOMER) != expected
+    assert render_hash(INVOICE, {**ISSUER, 'rib': {'iban': 'FR76'}},
+                       CUSTOMER) != expected
+    assert render_hash(INVOICE, ISSUER, {**CUSTOMER, 'name': 'New'}) \
+        != expected
+    monkeypatch.setattr(settings, 'PDF_TEMPLATE_VERSION', 'custom')
+    assert render_hash(INVOICE, ISSUER, CUSTOMER) != expected
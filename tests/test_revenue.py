@@ -0,0 +1,23 @@
+from datetime import datetime
+from uuid import uuid4
+
+from app import settings
+from app.core.documents import RevenueMonth
+from app.core.routers.revenue import revenue_report
+
+
+def test_revenue_report():
+    issuer = uuid4()
+    months = [RevenueMonth.construct(
+        issuer=issuer, month=datetime(2026, month, 1),
+        invoices=1, total_without_charge_cents=10000 * month,
+        total_vat_cents=2000 * month, total_cents=12000 * month)
+        for month in (1, 3, 11)]
+    report = revenue_report(2026, months, today=datetime(2026, 6, 15))
+    assert [quarter.total_without_charge for quarter in report.quarters] \
+        == [400, 0, 0, 1100]
+    assert report.total.invoices == 3
+    assert report.total.total_vat == 300
+    assert report.total.total == 1800
+    assert report.year_to_date == 400
+    assert report.ceiling_share == 400 / settings.REVENUE_CEILING
@@ -0,0 +1,45 @@
+import asyncio
+import moto
+import pytest
+
+from app import settings
+from app.core import utils
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    monkeypatch.setattr(settings, 'AWS_BUCKET_NAME', 'invoices')
+    monkeypatch.setattr(settings, 'AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setattr(settings, 'AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_s3():
+        utils.reset_s3_client()
+        utils.get_s3_client().create_bucket(
+            Bucket='invoices',
+            CreateBucketConfiguration={'LocationConstraint': 'eu-west-3'})
+        yield 'invoices'
+    utils.reset_s3_client()
+
+
+def test_client_is_shared(bucket):
+    assert utils.get_s3_client() is utils.get_s3_client()
+
+
+def test_upload_and_presign(bucket, tmp_path):
+    pdf = tmp_path / 'invoice.pdf'
+    pdf.write_bytes(b'%PDF-1.4')
+    assert not utils.object_exists('invoice.pdf')
+    assert utils.upload_file(str(pdf))
+    assert utils.object_exists('invoice.pdf')
+    url = utils.create_presigned_url('invoice.pdf', expiration=60)
+    assert 'invoice.pdf' in url and 'X-Amz-Expires=60' in url
+
+
+def test_async_wrappers(bucket, tmp_path):
+    pdf = tmp_path / 'quotation.pdf'
+    pdf.write_bytes(b'%PDF-1.4')
+
+    async def scenario():
+        assert await utils.upload_file_async(str(pdf))
+        return await utils.object_exists_async('quotation.pdf')
+
+    assert asyncio.run(scenario())
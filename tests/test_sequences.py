@@ -0,0 +1,19 @@
+from app.core.sequences import (DEFAULT_PREFIX, ParsedReference,
+                                format_reference, parse_reference)
+
+
+def test_parse_reference():
+    assert parse_reference('2021-005', 2021) == \
+        ParsedReference(2021, DEFAULT_PREFIX, 3, 5)
+    assert parse_reference('FA-2021-0042', 2022) == \
+        ParsedReference(2021, 'FA-{year}-', 4, 42)
+    assert parse_reference('F42', 2022) == ParsedReference(2022, 'F', 2, 42)
+    assert parse_reference('Devis', 2022) is None
+    assert parse_reference(None, 2022) is None
+
+
+def test_format_keeps_the_scheme():
+    parsed = parse_reference('FA-2021-0042', 2021)
+    assert format_reference(2022, 1, parsed.prefix, parsed.width) == \
+        'FA-2022-0001'
+    assert format_reference(2022, 1234) == '2022-1234'
@@ -0,0 +1,44 @@
+import importlib
+
+import main
+from app import settings
+
+
+def test_server_options(monkeypatch):
+    monkeypatch.setattr(settings, 'DEBUG', True)
+    options = main.server_options()
+    assert options['reload'] is True
+    assert 'workers' not in options
+
+    monkeypatch.setattr(settings, 'DEBUG', False)
+    monkeypatch.setattr(settings, 'SERVER_WORKERS', 4)
+    options = main.server_options()
+    assert 'reload' not in options
+    assert options['workers'] == 4
+    assert options['backlog'] == settings.SERVER_BACKLOG
+
+
+def test_export_processes(tmp_path):
+    environ = {'METRICS_DIR': str(tmp_path)}
+    (tmp_path / '123.json').write_text('{}')
+    main.export_processes(4, environ)
+    assert environ['SERVER_PROCESSES'] == '4'
+    assert not list(tmp_path.iterdir())
+
+    environ = {}
+    main.export_processes(1, environ)
+    assert environ == {'SERVER_PROCESSES': '1'}
+
+
+def test_caches_stay_on_with_several_processes(monkeypatch):
+    monkeypatch.setenv('SERVER_PROCESSES', '4')
+    try:
+        importlib.reload(settings)
+        assert settings.USER_CACHE_BACKEND.endswith('InMemoryUserCache')
+        assert settings.USER_CACHE_TTL == 30
+        assert settings.PUBLIC_LINK_CACHE_SIZE > 0
+        assert settings.PUBLIC_LINK_CACHE_TTL == 30
+    finally:
+        monkeypatch.undo()
+        importlib.reload(settings)
+    assert settings.USER_CACHE_TTL == 300
@@ -0,0 +1,51 @@
+from datetime import datetime
+from uuid import uuid4
+
+from app.core.documents import Invoice
+from app.core.models import Prestation
+from app.core.money import totals
+from app.core.stats import REVENUE_FIELDS, invoice_deltas
+
+
+def invoice(emited, *lines):
+    prestations = [Prestation(title=title, unit_price=price,
+                              quantity=quantity, vat=20)
+                   for title, price, quantity in lines]
+    amounts = totals(prestations)
+    return Invoice.construct(
+        emited=emited, issuer=uuid4(), prestations=prestations,
+        **{field: amounts[field] for field in REVENUE_FIELDS})
+
+
+def test_update_moves_amounts_between_months_and_titles():
+    previous = invoice(datetime(2026, 3, 10), ('Dev', 10.1, 3),
+                       ('Conseil', 50, 1))
+    current = invoice(datetime(2026, 3, 20), ('Dev', 10.1, 2))
+    revenue, stats = invoice_deltas(previous, current)
+    assert revenue == {datetime(2026, 3, 1): {
+        'invoices': 0, 'total_without_charge_cents': -6010,
+        'total_vat_cents': -1202, 'total_cents': -7212}}
+    assert stats == {
+        ('Dev', datetime(2026, 3, 1)): {
+            'lines': 0, 'total_unit': -1,
+            'total_without_charge_cents': -1010},
+        ('Conseil', datetime(2026, 3, 1)): {
+            'lines': -1, 'total_unit': -1,
+            'total_without_charge_cents': -5000}}
+
+    moved = invoice(datetime(2026, 4, 1), ('Dev', 10.1, 3),
+                    ('Conseil', 50, 1))
+    revenue, stats = invoice_deltas(previous, moved)
+    assert revenue[datetime(2026, 3, 1)]['invoices'] == -1
+    assert revenue[datetime(2026, 4, 1)] == {
+        'invoices': 1, 'total_without_charge_cents': 8030,
+        'total_vat_cents': 1606, 'total_cents': 9636}
+    assert stats[('Dev', datetime(2026, 4, 1))]['lines'] == 1
+
+
+def test_deletion_takes_the_invoice_back():
+    previous = invoice(datetime(2026, 3, 10), ('Dev', 10.1, 3))
+    revenue, stats = invoice_deltas(previous, None)
+    assert revenue[datetime(2026, 3, 1)]['invoices'] == -1
+    assert stats == {('Dev', datetime(2026, 3, 1)): {
+        'lines': -1, 'total_unit': -3, 'total_without_charge_cents': -3030}}
@@ -0,0 +1,46 @@
+import asyncio
+import io
+import zipfile
+
+from app.core.streaming import ZipStream, encode_csv, encode_xlsx
+
+
+async def chunks():
+    yield [{'title': 'Dev', 'total': 1.5}]
+    yield [{'title': 'R&D <web>', 'total': None}]
+
+
+def collect(encoder):
+    async def run():
+        return [chunk async for chunk in encoder(['title', 'total'],
+                                                 chunks())]
+    return asyncio.run(run())
+
+
+def test_encode_csv():
+    data = b''.join(collect(encode_csv)).decode()
+    assert data.splitlines() == ['title,total', 'Dev,1.5', 'R&D <web>,']
+
+
+def test_encode_xlsx_is_a_valid_archive():
+    data = b''.join(collect(encode_xlsx))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+    assert '<t>R&amp;D &lt;web&gt;</t>' in sheet
+    assert sheet.endswith('</sheetData></worksheet>')
+
+
+def test_zip_stream_stored_entries():
+    stream = ZipStream()
+    parts = []
+    with stream.open('a.pdf', compress_type=zipfile.ZIP_STORED) as entry:
+        for _ in range(3):
+            entry.write(b'%PDF' * 1000)
+            parts.append(stream.drain())
+    parts.append(stream.close())
+    with zipfile.ZipFile(io.BytesIO(b''.join(parts))) as archive:
+        assert archive.testzip() is None
+        info = archive.getinfo('a.pdf')
+    assert info.compress_type == zipfile.ZIP_STORED
+    assert info.file_size == 12000
@@ -0,0 +1,25 @@
+from datetime import datetime
+from uuid import uuid4
+
+from bson import ObjectId
+
+from app.core import trusted
+from app.core.documents import Quotation
+from app.responses import dumps
+
+
+def test_construct_from_stored_data():
+    stored = {'_id': ObjectId('6ad4b09c3158a9374191ad43'), 'reference': 'D-1',
+              'emited': datetime(2021, 11, 3), 'issuer': uuid4(),
+              'customer': ObjectId(), 'total_without_charge': 6.0,
+              'prestations': [{'title': 'Dev', 'unit_price': 2.0,
+                               'quantity': 3.0, 'vat': 0.0, 'total': 6.0}],
+              'legacy': True}
+    quotation = trusted.construct(Quotation, stored)
+    assert quotation.id == stored['_id']
+    assert quotation.title == 'Devis'
+    assert quotation.version == 0
+    assert not hasattr(quotation, 'legacy')
+    data = dumps(quotation)
+    assert data.startswith(b'{"_id":"6ad4b09c3158a9374191ad43",')
+    assert b'"prestations":[{"title":"Dev","unit_price":2.0' in data
@@ -0,0 +1,13 @@
+from app.core.models import InvoiceUpdateSchema
+from app.core.updates import changed_fields
+
+
+def test_changed_fields_recompute_the_total():
+    changes = InvoiceUpdateSchema(reference='2021-002', prestations=[
+        {'title': 'Dev', 'unit_price': 500, 'quantity': 2},
+        {'title': 'Conseil', 'unit_price': 80, 'quantity': 1.5}])
+    fields = changed_fields(changes)
+    assert fields['reference'] == '2021-002'
+    assert fields['total_without_charge'] == 1120
+    assert 'emited' not in fields
+    assert changed_fields(InvoiceUpdateSchema(reference=None)) == {}
@@ -0,0 +1,29 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from app.users.cache import InMemoryUserCache, UserCache
+
+
+def test_invalidate_drops_every_token_of_the_user():
+    cache = InMemoryUserCache(maxsize=2, ttl=60)
+    alice, bob = SimpleNamespace(id=uuid4()), SimpleNamespace(id=uuid4())
+
+    async def scenario():
+        await cache.set(alice, 'a1', 60)
+        await cache.set(bob, 'b1', 60)
+        # Evicts a1, nothing is left behind for it.
+        await cache.set(alice, 'a2', 60)
+        assert len(cache.entries) == 2
+        await cache.invalidate(alice.id)
+        return (await cache.get(alice.id, 'a2'),
+                await cache.get(bob.id, 'b1'))
+
+    assert asyncio.run(scenario()) == (None, bob)
+
+
+def test_backends_implement_the_interface():
+    with pytest.raises(TypeError):
+        UserCache()